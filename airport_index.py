@@ -0,0 +1,318 @@
+"""
+In-memory index over the OpenFlights-style airports dataset that ships with the frontend.
+Used by the backend to resolve cities to IATA codes and to validate GPT's airport guesses
+without a network call.
+"""
+
+import os
+import csv
+import math
+import heapq
+import bisect
+import difflib
+import threading
+from array import array
+
+EARTH_RADIUS_KM = 6371.0
+# ranges this small are scanned linearly instead of split further
+KD_LEAF_SIZE = 8
+
+AIRPORTS_PATH = os.environ.get(
+    'AIRPORTS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'components', 'flight', 'airports.txt')
+)
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+def normalize(text):
+    """
+    Function to normalize a city or airport name for lookups.
+    """
+    return ' '.join(str(text).lower().replace('-', ' ').split())
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Function to get the great-circle distance between two points in kilometres.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+class Airport:
+    """
+    Lightweight read-only view of one row of the index.
+    """
+    __slots__ = ('iata', 'icao', 'name', 'city', 'country', 'lat', 'lon', 'kind')
+
+    def __init__(self, iata, icao, name, city, country, lat, lon, kind):
+        self.iata = iata
+        self.icao = icao
+        self.name = name
+        self.city = city
+        self.country = country
+        self.lat = lat
+        self.lon = lon
+        self.kind = kind
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __repr__(self):
+        return f"Airport({self.iata or self.icao}, {self.name!r}, {self.city!r}, {self.country!r})"
+
+class AirportIndex:
+    """
+    Column-oriented airport table with code, city, prefix, fuzzy and nearest-neighbour lookups.
+
+    Rows live in parallel lists/arrays, the nearest-neighbour search is a KD-tree over
+    unit vectors on the sphere so it has no trouble at the poles or the antimeridian.
+    """
+
+    def __init__(self, rows):
+        """
+        @PARAMS:
+            - rows -> iterable of (iata, icao, name, city, country, lat, lon, kind)
+        """
+        self.iata = []
+        self.icao = []
+        self.name = []
+        self.city = []
+        self.country = []
+        self.kind = []
+        self.lat = array('d')
+        self.lon = array('d')
+        self._xyz = array('d')
+        coords = ([], [], [])
+
+        for iata, icao, name, city, country, lat, lon, kind in rows:
+            self.iata.append(iata)
+            self.icao.append(icao)
+            self.name.append(name)
+            self.city.append(city)
+            self.country.append(country)
+            self.kind.append(kind)
+            self.lat.append(lat)
+            self.lon.append(lon)
+            phi, lam = math.radians(lat), math.radians(lon)
+            point = (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+            self._xyz.extend(point)
+            for axis in range(3):
+                coords[axis].append(point[axis])
+
+        # exact code and city lookups, plus sorted keys for prefix search over city and airport names
+        self._by_code = {}
+        self._by_city = {}
+        keys = []
+        for i in range(len(self.name)):
+            if self.icao[i]:
+                self._by_code.setdefault(self.icao[i], i)
+            if self.iata[i]:
+                # IATA wins over a colliding ICAO code
+                self._by_code[self.iata[i]] = i
+            city_key = normalize(self.city[i])
+            name_key = normalize(self.name[i])
+            self._by_city.setdefault(city_key, []).append(i)
+            keys.append((city_key, i))
+            if name_key != city_key:
+                keys.append((name_key, i))
+        keys.sort()
+        self._prefix_keys = keys
+        self._prefix_words = [key for key, _ in keys]
+        self._city_names = sorted(self._by_city)
+
+        # KD-tree stored as a permutation of row ids, median of each range is the node
+        self._tree = array('l', range(len(self.name)))
+        self._axes = array('b', bytes(len(self.name)))
+        self._build(coords)
+
+    @classmethod
+    def from_file(cls, path=AIRPORTS_PATH):
+        """
+        Function to load the index from the airports.txt csv.
+
+        @PARAMS:
+            - path -> the OpenFlights-style csv file
+        """
+        def rows():
+            with open(path, 'r', encoding='utf-8') as file:
+                for row in csv.reader(file):
+                    if len(row) < 13:
+                        continue
+                    iata = row[4] if row[4] not in ('\\N', '') else ''
+                    icao = row[5] if row[5] not in ('\\N', '') else ''
+                    if not iata and not icao:
+                        continue
+                    try:
+                        lat, lon = float(row[6]), float(row[7])
+                    except ValueError:
+                        continue
+                    yield iata, icao, row[1], row[2], row[3], lat, lon, row[12]
+
+        return cls(rows())
+
+    def __len__(self):
+        return len(self.name)
+
+    def record(self, i):
+        return Airport(
+            self.iata[i], self.icao[i], self.name[i], self.city[i],
+            self.country[i], self.lat[i], self.lon[i], self.kind[i]
+        )
+
+    def is_airport(self, i):
+        """
+        Function to check a row is a real airport rather than a station, port or heliport.
+        """
+        return self.kind[i] == 'airport' and self.name[i] != 'All Airports' and 'heliport' not in self.name[i].lower()
+
+    def get(self, code):
+        """
+        Function to look up an airport by IATA or ICAO code.
+
+        @PARAMS:
+            - code -> the 3-letter IATA or 4-letter ICAO code
+        """
+        i = self._by_code.get(str(code).strip().upper())
+        return self.record(i) if i is not None else None
+
+    def is_iata(self, code):
+        i = self._by_code.get(str(code).strip().upper())
+        return i is not None and self.iata[i] == str(code).strip().upper()
+
+    def serving_city(self, city, airports_only=True):
+        """
+        Function to get all airports whose city matches exactly.
+
+        @PARAMS:
+            - city          -> the city name
+            - airports_only -> skip stations, ports, heliports and metro pseudo-codes
+        """
+        ids = self._by_city.get(normalize(city), [])
+        return [self.record(i) for i in ids if not airports_only or self.is_airport(i)]
+
+    def prefix(self, text, limit=10):
+        """
+        Function to find airports whose city or name starts with the text.
+
+        @PARAMS:
+            - text  -> the typed prefix
+            - limit -> max results
+        """
+        key = normalize(text)
+        if not key:
+            return []
+        results = []
+        seen = set()
+        start = bisect.bisect_left(self._prefix_words, key)
+        for word, i in self._prefix_keys[start:]:
+            if not word.startswith(key):
+                break
+            if i not in seen:
+                seen.add(i)
+                results.append(self.record(i))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def fuzzy_city(self, text, limit=3, cutoff=0.8):
+        """
+        Function to find the closest city names for a misspelled city.
+
+        @PARAMS:
+            - text   -> the city as the user typed it
+            - limit  -> max city names to return
+            - cutoff -> minimum similarity ratio
+        """
+        key = normalize(text)
+        if not key:
+            return []
+        # only compare against names with the same first letter, keeps this fast on 12k rows
+        start = bisect.bisect_left(self._city_names, key[0])
+        end = bisect.bisect_left(self._city_names, chr(ord(key[0]) + 1))
+        return difflib.get_close_matches(key, self._city_names[start:end], n=limit, cutoff=cutoff)
+
+    def nearest(self, lat, lon, n=5, airports_only=True, require_iata=True, max_km=None):
+        """
+        Function to find the n closest airports to a point.
+        Returns a list of (distance_km, Airport) sorted by distance.
+
+        @PARAMS:
+            - lat, lon      -> the point in degrees
+            - n             -> how many airports to return
+            - airports_only -> skip stations, ports, heliports and metro pseudo-codes
+            - require_iata  -> skip airports without an IATA code (closed or private fields)
+            - max_km        -> optional search radius
+        """
+        phi, lam = math.radians(lat), math.radians(lon)
+        target = (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+        # compare squared chord lengths, converted to km at the end
+        bound = float('inf')
+        if max_km is not None:
+            bound = (2 * math.sin(min(max_km / EARTH_RADIUS_KM, math.pi) / 2)) ** 2
+        heap = []
+
+        def consider(i):
+            x, y, z = self._xyz[3 * i], self._xyz[3 * i + 1], self._xyz[3 * i + 2]
+            dist = (x - target[0]) ** 2 + (y - target[1]) ** 2 + (z - target[2]) ** 2
+            wanted = (not airports_only or self.is_airport(i)) and (not require_iata or self.iata[i])
+            if dist <= bound and wanted:
+                if len(heap) < n:
+                    heapq.heappush(heap, (-dist, i))
+                elif dist < -heap[0][0]:
+                    heapq.heapreplace(heap, (-dist, i))
+
+        def search(lo, hi):
+            if hi - lo <= KD_LEAF_SIZE:
+                for position in range(lo, hi):
+                    consider(self._tree[position])
+                return
+            mid = (lo + hi) // 2
+            i = self._tree[mid]
+            axis = self._axes[mid]
+            consider(i)
+
+            diff = target[axis] - self._xyz[3 * i + axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            search(*near)
+            worst = -heap[0][0] if len(heap) >= n else bound
+            if diff * diff <= worst:
+                search(*far)
+
+        search(0, len(self._tree))
+        results = sorted((-neg, i) for neg, i in heap)
+        return [(2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(d) / 2, 1.0)), self.record(i)) for d, i in results]
+
+    def _build(self, coords):
+        """
+        Function to arrange _tree into a balanced KD-tree, iteratively.
+
+        @PARAMS:
+            - coords -> the x, y and z lists used as sort keys
+        """
+        stack = [(0, len(self._tree), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= KD_LEAF_SIZE:
+                continue
+            axis = depth % 3
+            self._tree[lo:hi] = array('l', sorted(self._tree[lo:hi], key=coords[axis].__getitem__))
+            mid = (lo + hi) // 2
+            self._axes[mid] = axis
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+
+def get_airport_index():
+    """
+    Function to get the container-wide airport index, loaded on first use.
+    Returns an empty index if the dataset is missing so callers degrade to GPT only.
+    """
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            try:
+                _INDEX = AirportIndex.from_file(AIRPORTS_PATH)
+            except OSError as e:
+                print(f"Error loading airports from {AIRPORTS_PATH}: {str(e)}")
+                _INDEX = AirportIndex([])
+        return _INDEX
@@ -0,0 +1,408 @@
+"""
+Long-running server mode: serves the same pipeline as lambda_handler over HTTP from one
+process, for running the backend as a container instead of one lambda per request.
+It is an ASGI app (`app`), served by uvicorn, which does the HTTP parsing, keep-alive and
+graceful shutdown.
+
+POST any path with the API Gateway body (the JSON the frontend sends) and get back the
+statusCode, headers and body lambda_handler would have returned. A streamed request
+({"stream": true}) is sent event by event as it is produced instead of buffered; this is
+the only place streaming is served, the lambda runtime can't flush a body early.
+GET /healthz answers while the process is up, GET /readyz while it can take traffic.
+
+This is a thread-pool server. The provider clients (OpenAI, Perplexity, SerpAPI) are the
+blocking requests sessions lambda_handler uses, so each request holds one of
+SERVER_WORKERS threads for its whole pipeline and a process serves at most SERVER_WORKERS
+requests at once; the event loop only does the socket I/O. Scale with more workers or more
+processes. Requests past SERVER_WORKERS + SERVER_QUEUE_SIZE get a 503 with Retry-After
+right away instead of queueing behind work they would time out on.
+
+Usage:
+    pip install uvicorn
+    SERVER_WORKERS=64 python api_server.py [--host 0.0.0.0] [--port 8080]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+import contextvars
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8080'))
+# requests running at once, each holds a thread for its whole pipeline
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', '64'))
+# requests admitted to wait for a worker, anything past this is turned away with a 503
+SERVER_QUEUE_SIZE = int(os.environ.get('SERVER_QUEUE_SIZE', '256'))
+# what a request gets end to end, time spent queued included (the lambda timeout in server mode)
+SERVER_REQUEST_TIMEOUT_MS = int(os.environ.get('SERVER_REQUEST_TIMEOUT_MS', '29000'))
+SERVER_MAX_BODY_BYTES = int(os.environ.get('SERVER_MAX_BODY_BYTES', str(1024 * 1024)))
+# idle keep-alive connections are dropped after this
+SERVER_IDLE_TIMEOUT = int(os.environ.get('SERVER_IDLE_TIMEOUT', '30'))
+# on SIGTERM, how long requests in flight get to finish
+SERVER_DRAIN_SECONDS = int(os.environ.get('SERVER_DRAIN_SECONDS', '25'))
+SERVER_RETRY_AFTER = int(os.environ.get('SERVER_RETRY_AFTER', '1'))
+
+# the shared pools and connection pools are sized for one lambda request at a time, scale
+# them to the workers unless they are set explicitly (read when api_code is imported)
+os.environ.setdefault('HTTP_POOL_SIZE', str(SERVER_WORKERS))
+os.environ.setdefault('FANOUT_WORKERS', str(SERVER_WORKERS * 2))
+os.environ.setdefault('HEDGE_WORKERS', str(SERVER_WORKERS))
+os.environ.setdefault('REFRESH_WORKERS', str(max(SERVER_WORKERS // 8, 2)))
+
+import api_code
+
+SERVER_STATS = {"requests": 0, "streamed": 0, "rejected": 0, "errors": 0, "disconnects": 0}
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+}
+
+class ServerContext:
+    """
+    Stand-in for the lambda context, so lambda_handler gets a request id and a deadline
+    that counts from when the request arrived rather than from when a worker picked it up.
+
+    @PARAMS:
+        - request_id  -> the request id, also used for the trace
+        - received_at -> time.monotonic() when the request was read
+    """
+
+    def __init__(self, request_id, received_at):
+        self.aws_request_id = request_id
+        self.received_at = received_at
+
+    def get_remaining_time_in_millis(self):
+        return max(int(SERVER_REQUEST_TIMEOUT_MS - (time.monotonic() - self.received_at) * 1000), 0)
+
+class ApiServer:
+    """
+    The ASGI app. Tracks the requests admitted (running or waiting for a worker) to apply
+    backpressure, and whether it is still taking traffic.
+
+    @PARAMS:
+        - workers    -> threads running requests
+        - queue_size -> requests that may wait for a thread
+    """
+
+    def __init__(self, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="traveler-server")
+        self.admitted = 0
+        self.running = 0
+        self.ready = False
+        self.draining = False
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **SERVER_STATS,
+                "running": self.running,
+                "queued": self.admitted - self.running,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "ready": self.ready and not self.draining
+            }
+
+    def admit(self):
+        """
+        Function to take a slot for a new request, False when the queue is full.
+        """
+        with self._lock:
+            if self.admitted >= self.workers + self.queue_size:
+                SERVER_STATS["rejected"] += 1
+                return False
+            self.admitted += 1
+            SERVER_STATS["requests"] += 1
+            return True
+
+    def finish(self):
+        with self._lock:
+            self.admitted -= 1
+
+    def _count(self, field, delta=1):
+        with self._lock:
+            SERVER_STATS[field] += delta
+
+    def _running(self, delta):
+        with self._lock:
+            self.running += delta
+
+    def invoke(self, event, context):
+        """
+        Function to run one request through lambda_handler on a worker thread.
+        The direct hotel search returns its payload without the API Gateway wrapping.
+        """
+        self._running(1)
+        try:
+            result = api_code.lambda_handler(event, context)
+        except Exception as e:
+            print(f"Error handling request {context.aws_request_id}: {str(e)}")
+            self._count("errors")
+            result = {'statusCode': 500, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps({'error': 'Internal server error'})}
+        finally:
+            self._running(-1)
+        if 'statusCode' not in result:
+            return {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(result)}
+        return result
+
+    def stream(self, body, context, put, cancelled):
+        """
+        Function to run a streamed request on a worker thread, handing each server-sent
+        event to put() as stream_search yields it. Stops early when the client has gone.
+
+        @PARAMS:
+            - body      -> the parsed request body
+            - context   -> the ServerContext of the request
+            - put       -> called with each chunk, then with None at the end
+            - cancelled -> threading.Event set when the client disconnects
+        """
+        self._running(1)
+        api_code.start_request(context.aws_request_id)
+        api_code.start_deadline(context)
+        api_code.start_recording(context.aws_request_id, json.dumps(body))
+        try:
+            with api_code.span("request"):
+                conversation_history = api_code.extract_conversation_history(body.get('context', 'Be accurate and straightforward.'))
+                events = api_code.stream_search(body, conversation_history)
+                try:
+                    for chunk in events:
+                        if cancelled.is_set():
+                            break
+                        put(chunk)
+                finally:
+                    events.close()
+        except Exception as e:
+            print(f"Error streaming request {context.aws_request_id}: {str(e)}")
+            self._count("errors")
+            put(api_code.sse_event('error', {"error": "Internal server error"}))
+        finally:
+            api_code.finish_recording()
+            api_code.end_request()
+            self._running(-1)
+            put(None)
+
+    async def run_in_worker(self, fn, *args):
+        # a fresh context per request, worker threads keep the contextvars of their last task
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, contextvars.Context().run, fn, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope["type"] == 'http':
+            await self.route(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """
+        Function to warm up on startup and drain on shutdown.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == 'lifespan.startup':
+                await self.start()
+                await send({"type": 'lifespan.startup.complete'})
+            elif message["type"] == 'lifespan.shutdown':
+                await self.drain()
+                await send({"type": 'lifespan.shutdown.complete'})
+                return
+
+    async def route(self, scope, receive, send):
+        """
+        Function to answer one request.
+        """
+        received_at = time.monotonic()
+        method, path = scope["method"], scope["path"]
+        json_headers = {'Content-Type': 'application/json'}
+        if method == 'GET' and path == '/healthz':
+            return await send_response(send, 200, json_headers, json.dumps({"status": "ok"}))
+        if method == 'GET' and path == '/readyz':
+            stats = self.stats()
+            ready = stats["ready"] and stats["queued"] < self.queue_size
+            return await send_response(send, 200 if ready else 503, json_headers, json.dumps({"status": "ready" if ready else "unavailable", **stats}))
+        if method == 'OPTIONS':
+            return await send_response(send, 204, CORS_HEADERS, '')
+        if method != 'POST':
+            return await send_response(send, 405, json_headers, json.dumps({'error': HTTPStatus(405).phrase}))
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope["headers"]}
+        body = await read_body(receive, headers)
+        if body is None:
+            self._count("disconnects")
+            return
+        if isinstance(body, int):
+            return await send_response(send, body, json_headers, json.dumps({'error': HTTPStatus(body).phrase}))
+
+        if self.draining or not self.admit():
+            headers = {**json_headers, **CORS_HEADERS, 'Retry-After': str(SERVER_RETRY_AFTER)}
+            return await send_response(send, 503, headers, json.dumps({'error': 'Server is busy, retry shortly'}))
+        try:
+            context = ServerContext(headers.get('x-request-id') or uuid.uuid4().hex, received_at)
+            body = body.decode('utf-8', errors='replace')
+            parsed = parse_body(body)
+            if streamable(parsed):
+                return await self.respond_stream(parsed, context, receive, send)
+            event = {
+                "body": body,
+                "httpMethod": method,
+                "path": path,
+                "headers": headers,
+                "requestContext": {"requestId": context.aws_request_id}
+            }
+            result = await self.run_in_worker(self.invoke, event, context)
+            await send_response(send, result.get('statusCode', 200), result.get('headers') or {}, result.get('body') or '')
+        finally:
+            self.finish()
+
+    async def respond_stream(self, body, context, receive, send):
+        """
+        Function to send a streamed request's events as they are produced.
+        """
+        self._count("streamed")
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        cancelled = threading.Event()
+        put = lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        worker = asyncio.ensure_future(self.run_in_worker(self.stream, body, context, put, cancelled))
+
+        async def watch_disconnect():
+            # the body is read, the next message is the client going away
+            while (await receive())["type"] != 'http.disconnect':
+                pass
+            cancelled.set()
+        watcher = asyncio.ensure_future(watch_disconnect())
+
+        headers = {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'}
+        try:
+            await send({"type": 'http.response.start', "status": 200, "headers": encode_headers(headers)})
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                # once the client is gone the worker stops at its next event, drain until then
+                if not cancelled.is_set():
+                    await send({"type": 'http.response.body', "body": chunk.encode('utf-8'), "more_body": True})
+            if not cancelled.is_set():
+                await send({"type": 'http.response.body', "body": b'', "more_body": False})
+        except OSError:
+            cancelled.set()
+        finally:
+            if cancelled.is_set():
+                self._count("disconnects")
+            watcher.cancel()
+            await worker
+
+    async def start(self):
+        # warm the container before saying we're ready, a bad config keeps /readyz failing
+        try:
+            await self.run_in_worker(api_code.warm_up)
+            self.ready = True
+        except Exception as e:
+            print(f"Server not ready, warm up failed: {str(e)}")
+        print(f"Serving with {self.workers} workers and a queue of {self.queue_size}")
+
+    async def drain(self):
+        """
+        Function to stop taking traffic and give requests in flight time to finish.
+        """
+        self.draining = True
+        print(f"Draining {self.stats()['running']} running requests")
+        give_up = time.monotonic() + SERVER_DRAIN_SECONDS
+        while self.stats()["running"] + self.stats()["queued"] and time.monotonic() < give_up:
+            await asyncio.sleep(0.1)
+        if self.stats()["running"]:
+            print("Drain timed out, stopping with requests in flight")
+        self.executor.shutdown(wait=False)
+
+def parse_body(body):
+    """
+    Function to read the JSON body for routing, None when it isn't a JSON object.
+    lambda_handler does its own parsing and error handling.
+    """
+    try:
+        parsed = json.loads(body or '{}')
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+def streamable(body):
+    """
+    Function to check a request can be streamed straight from stream_search. Anything
+    else, invalid requests included, goes through lambda_handler for its usual answer.
+    """
+    if body is None or not body.get('stream') or not body.get('prompt') or 'batch' in body or body.get('cursor'):
+        return False
+    try:
+        api_code.parse_weights(body.get('weights'))
+        api_code.parse_view(*(body.get(field) for field in api_code.VIEW_FIELDS))
+        if body.get('isDirectFlightSearch') and body.get('flightParams') and body.get('flexibleDates'):
+            api_code.flexible_date_cells(body['flightParams'], body['flexibleDates'])
+    except ValueError:
+        return False
+    return True
+
+async def read_body(receive, headers):
+    """
+    Function to read a request body, held to SERVER_MAX_BODY_BYTES. Returns the body,
+    an error status for a body we won't read, or None when the client went away.
+    """
+    try:
+        if int(headers.get('content-length', '0')) > SERVER_MAX_BODY_BYTES:
+            return 413
+    except ValueError:
+        return 400
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == 'http.disconnect':
+            return None
+        chunk = message.get("body", b'')
+        size += len(chunk)
+        if size > SERVER_MAX_BODY_BYTES:
+            return 413
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b''.join(chunks)
+
+def encode_headers(headers):
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers.items()]
+
+async def send_response(send, status, headers, body):
+    data = body.encode('utf-8') if isinstance(body, str) else body
+    headers = {**headers, 'Content-Length': str(len(data))}
+    await send({"type": 'http.response.start', "status": status, "headers": encode_headers(headers)})
+    await send({"type": 'http.response.body', "body": data})
+
+app = ApiServer()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the traveler API from one long-running process")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("Error starting the server: uvicorn is not installed (pip install uvicorn)")
+        return 1
+    uvicorn.run(
+        app,
+        host=args.host,
+        port=args.port,
+        lifespan='on',
+        timeout_keep_alive=SERVER_IDLE_TIMEOUT,
+        timeout_graceful_shutdown=SERVER_DRAIN_SECONDS,
+        access_log=False
+    )
+
+if __name__ == '__main__':
+    sys.exit(main())
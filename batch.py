@@ -0,0 +1,144 @@
+"""
+Batch requests: several searches or prompts in one invocation. Each item goes through the
+normal request handler on its own thread, a few at a time, and gets its own status, so one
+failing item doesn't fail the batch. Identical items run once.
+"""
+
+import os
+import json
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from telemetry import bind, span
+
+# most items per request and most run at once (a request may ask for fewer)
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '25'))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', '4'))
+# top-level fields of a batch request that are not copied into its items
+BATCH_ONLY_FIELDS = ('batch', 'concurrency', 'stream')
+
+def batch_item_body(item, defaults):
+    """
+    Function to turn one batch item into the request body handle_event expects.
+    An item is a prompt string, or an object with flightParams, hotelParams or a prompt;
+    fields it doesn't set come from the batch request (context, fullPayload).
+
+    @PARAMS:
+        - item     -> the batch entry
+        - defaults -> the batch request's own fields
+    """
+    if isinstance(item, str):
+        item = {"prompt": item}
+    if not isinstance(item, dict) or 'batch' in item:
+        raise ValueError("Batch items must be a prompt or an object without a batch of its own")
+    body = {**defaults, **item}
+    body.pop('stream', None)
+    if body.get('flightParams') and not body.get('hotelParams'):
+        flight_params = body['flightParams']
+        body.setdefault('isDirectFlightSearch', True)
+        body.setdefault('prompt', f"Flights from {flight_params.get('departure_id', '')} to {flight_params.get('arrival_id', '')}")
+    elif body.get('hotelParams'):
+        body.setdefault('prompt', f"Hotels in {body['hotelParams'].get('q', '')}")
+    return body
+
+def parse_batch(body):
+    """
+    Function to check a batch request and return its items and how many run at once.
+    Raises ValueError for a batch that is empty, over BATCH_MAX_ITEMS, nests another batch
+    or asks for a concurrency that isn't a number; other bad items get their own 400.
+
+    @PARAMS:
+        - body -> the request body, with a 'batch' list and optionally 'concurrency'
+    """
+    items = body.get('batch')
+    if not isinstance(items, list) or not items:
+        raise ValueError("batch must be a non-empty list")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"batch has {len(items)} items, the limit is {BATCH_MAX_ITEMS}")
+    if any(isinstance(item, dict) and 'batch' in item for item in items):
+        raise ValueError("Batch items can't hold a batch of their own")
+    concurrency = body.get('concurrency') or BATCH_MAX_CONCURRENCY
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int):
+        raise ValueError("concurrency must be an integer")
+    return items, max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+def run_batch_item(handle, body):
+    """
+    Function to run one batch item through the request handler and return its status and payload.
+    """
+    result = handle({"body": json.dumps(body)})
+    # the direct hotel search returns its payload without the API Gateway wrapping
+    if 'statusCode' not in result:
+        return 200, result
+    payload = json.loads(result['body'])
+    return result['statusCode'], payload
+
+def run_batch(body, handle, executor):
+    """
+    Function to run every item of a batch request inside this invocation, at most
+    `concurrency` at a time, and return the results in the order of the items.
+    Identical items run once. A failing item gets its own error and doesn't fail the batch.
+
+    @PARAMS:
+        - body     -> the request body, with a 'batch' list and optionally 'concurrency'
+        - handle   -> the request handler each item goes through, handle_event
+        - executor -> the pool the items run on
+    Raises ValueError for an invalid batch, see parse_batch.
+    """
+    items, concurrency = parse_batch(body)
+    defaults = {key: value for key, value in body.items() if key not in BATCH_ONLY_FIELDS}
+
+    results = [None] * len(items)
+    # key of the first occurrence of every distinct item -> its index and body
+    unique = {}
+    duplicates = {}
+    for index, item in enumerate(items):
+        try:
+            item_body = batch_item_body(item, defaults)
+        except ValueError as e:
+            results[index] = {"index": index, "status": 400, "error": str(e)}
+            continue
+        key = json.dumps(item_body, sort_keys=True)
+        if key in unique:
+            duplicates[index] = unique[key][0]
+        else:
+            unique[key] = (index, item_body)
+
+    print(f"Processing batch of {len(items)} items, {len(unique)} distinct, {concurrency} at a time")
+    queued = list(unique.values())
+    running = {}
+    with span("batch", items=len(items), distinct=len(unique)):
+        while queued or running:
+            while queued and len(running) < concurrency:
+                index, item_body = queued.pop(0)
+                running[executor.submit(bind(run_batch_item), handle, item_body)] = index
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    status, payload = future.result()
+                except Exception as e:
+                    status, payload = 500, {"response": str(e)}
+                if status == 200:
+                    results[index] = {"index": index, "status": status, "result": payload}
+                else:
+                    results[index] = {"index": index, "status": status, "error": payload.get('response', '')}
+
+    for index, original in duplicates.items():
+        results[index] = {**results[original], "index": index, "duplicate_of": original}
+
+    with span("serialize") as stage:
+        response_body = json.dumps({
+            "results": results,
+            "items": len(items),
+            "distinct": len(unique),
+            "errors": sum(1 for result in results if result["status"] != 200)
+        })
+        stage.set("BytesOut", len(response_body))
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': response_body
+    }
@@ -0,0 +1,71 @@
+"""
+Benchmark for the airport index: load time and per-lookup latency.
+
+Usage:
+    python benchmarks/airport_index_bench.py [--repeat 2000] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from airport_index import AirportIndex, AIRPORTS_PATH
+
+def time_op(fn, inputs, repeat):
+    """
+    Function to time an operation over a rotating set of inputs.
+    Returns the mean and p99 latency in microseconds.
+    """
+    samples = []
+    for i in range(repeat):
+        arg = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        "mean_us": round(sum(samples) / len(samples), 2),
+        "p99_us": round(samples[int(len(samples) * 0.99) - 1], 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    loads = []
+    for _ in range(3):
+        start = time.perf_counter()
+        index = AirportIndex.from_file(AIRPORTS_PATH)
+        loads.append((time.perf_counter() - start) * 1000)
+
+    rng = random.Random(7)
+    codes = [code for code in index.iata if code][:500] + ['KJFK', 'EGLL', 'ZZZ']
+    cities = ['Paris', 'London', 'New York', 'Denver', 'Tokyo', 'Chicago', 'Portland', 'Nowhere']
+    points = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(200)]
+
+    results = {
+        "rows": len(index),
+        "load_ms": {"min": round(min(loads), 2), "max": round(max(loads), 2)},
+        "lookups": {
+            "get": time_op(index.get, codes, args.repeat),
+            "serving_city": time_op(index.serving_city, cities, args.repeat),
+            "prefix": time_op(lambda text: index.prefix(text, 10), ['san', 'lon', 'new y', 'fra', 'x'], args.repeat),
+            "fuzzy_city": time_op(index.fuzzy_city, ['chicgo', 'londn', 'pariss', 'tokio'], args.repeat),
+            "nearest_5": time_op(lambda point: index.nearest(point[0], point[1], 5), points, args.repeat),
+        }
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
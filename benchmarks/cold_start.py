@@ -0,0 +1,126 @@
+"""
+Cold-start benchmark for the lambda: import time of api_code, then the first (cold) and
+second (warm) request, each measured in a fresh process against the local stubs.
+Also lists the slowest modules from `python -X importtime`.
+
+Usage:
+    python benchmarks/cold_start.py [--runs 5] [--warm-on-init] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import PROVIDERS, StubConfig, start_stubs, stub_env
+from offline_bench import SCENARIOS, BenchContext, git_commit, peak_rss_mb
+
+def measure(scenario):
+    """
+    Function run in the child process: import, then two requests.
+    """
+    started = time.perf_counter()
+    import api_code
+    import_ms = (time.perf_counter() - started) * 1000
+    rss_after_import = peak_rss_mb()
+
+    event = {"body": json.dumps(SCENARIOS[scenario])}
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        started = time.perf_counter()
+        api_code.lambda_handler(event, BenchContext("cold"))
+        first_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        api_code.lambda_handler(event, BenchContext("warm"))
+        second_ms = (time.perf_counter() - started) * 1000
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    return {
+        "import_ms": round(import_ms, 2),
+        "first_request_ms": round(first_ms, 2),
+        "second_request_ms": round(second_ms, 2),
+        "rss_after_import_mb": rss_after_import,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def slowest_imports(env, limit):
+    """
+    Function to get the modules with the highest self import time under -X importtime.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import api_code'],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    rows.sort(key=lambda row: row["self_ms"], reverse=True)
+    return rows[:limit]
+
+def summarize(runs, field):
+    values = [run[field] for run in runs]
+    return {"median": round(statistics.median(values), 2), "min": min(values), "max": max(values)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="fresh processes to measure")
+    parser.add_argument('--scenario', default='full_plan', choices=list(SCENARIOS))
+    parser.add_argument('--latency-ms', type=float, default=0, help="stub upstream latency, 0 isolates local work")
+    parser.add_argument('--warm-on-init', action='store_true', help="set WARM_ON_INIT for the lambda")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.scenario)))
+        return
+
+    stubs = start_stubs({provider: StubConfig(latency_ms=args.latency_ms, jitter=0) for provider in PROVIDERS})
+    env = {
+        **os.environ, **stub_env(stubs),
+        "OPENAI_API_KEY": "bench", "PERPLEXITY_API_KEY": "bench", "SERPAI_API_KEY": "bench",
+        "SEARCH_CACHE_ENABLED": "false", "WARM_ON_INIT": "true" if args.warm_on_init else "false",
+    }
+    try:
+        runs = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', '--scenario', args.scenario],
+                cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        imports = slowest_imports(env, args.top)
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+
+    results = {
+        "commit": git_commit(),
+        "scenario": args.scenario,
+        "warm_on_init": args.warm_on_init,
+        "runs": len(runs),
+        **{field: summarize(runs, field) for field in runs[0]},
+        "slowest_imports": imports,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
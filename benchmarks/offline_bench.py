@@ -0,0 +1,225 @@
+"""
+Offline benchmark for lambda_handler: runs a request mix against local stub servers for
+OpenAI, Perplexity and SerpAPI (see stubs.py) so no live API is called or paid for.
+
+Each scenario runs in its own process by default, so its peak RSS is its own, and reports
+throughput, p50/p95/p99 latency, peak RSS and upstream calls/bytes per request.
+
+Usage:
+    python benchmarks/offline_bench.py [--requests 30] [--concurrency 4] [--latency-ms 200]
+        [--error-rate 0.0] [--items 20] [--scenarios flight,hotel] [--output results.json]
+
+Compare two commits by diffing their --output files.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stubs import PROVIDERS, StubConfig, start_stubs, stub_env, trip_dates
+
+OUTBOUND, CHECK_OUT = trip_dates()
+SCENARIOS = {
+    "question": {"prompt": "What is the best time of year to visit Lisbon?"},
+    "flight": {"prompt": "Find me a one-way flight from JFK to LHR next month"},
+    "hotel": {"prompt": "Find a hotel in Rome for three nights next month"},
+    "full_plan": {"prompt": "Plan a trip from BOS to CDG to Paris next month with a $3000 budget"},
+    "direct_flight": {
+        "prompt": "Flights from JFK to CDG",
+        "isDirectFlightSearch": True,
+        "flightParams": {"departure_id": "JFK", "arrival_id": "CDG", "outbound_date": OUTBOUND, "type": 2}
+    },
+    "direct_hotel": {
+        "prompt": "Hotels in Paris",
+        "hotelParams": {"q": "Paris", "check_in_date": OUTBOUND, "check_out_date": CHECK_OUT, "adults": 2}
+    },
+}
+# the "mix" scenario draws from the others with these weights
+MIX_WEIGHTS = {"question": 3, "flight": 2, "hotel": 2, "full_plan": 2, "direct_flight": 1, "direct_hotel": 1}
+
+class BenchContext:
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+def percentile(samples, pct):
+    """
+    Function to get the nearest-rank percentile of a sorted list.
+    """
+    if not samples:
+        return None
+    rank = max(int(round(pct / 100 * len(samples) + 0.5)) - 1, 0)
+    return round(samples[min(rank, len(samples) - 1)], 2)
+
+def peak_rss_mb():
+    # ru_maxrss is KB on linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def upstream_stats():
+    """
+    Function to read every stub's counters through its /__stats endpoint.
+    """
+    stats = {}
+    for provider in PROVIDERS:
+        url = os.environ[f"{provider.upper()}_URL"]
+        base = url.split('/', 3)[:3]
+        with urllib.request.urlopen('/'.join(base) + '/__stats') as response:
+            stats[provider] = json.loads(response.read())
+    return stats
+
+def scenario_bodies(name, count, seed=7):
+    if name != 'mix':
+        return [SCENARIOS[name]] * count
+    rng = random.Random(seed)
+    names = rng.choices(list(MIX_WEIGHTS), weights=list(MIX_WEIGHTS.values()), k=count)
+    return [SCENARIOS[pick] for pick in names]
+
+def run_scenario(name, requests, concurrency, warmup):
+    """
+    Function to drive lambda_handler with one scenario and measure it.
+    Expects the stub URLs and api keys to already be in the environment.
+
+    @PARAMS:
+        - name        -> a SCENARIOS key or 'mix'
+        - requests    -> measured requests
+        - concurrency -> requests in flight at once
+        - warmup      -> unmeasured requests run first (imports, pools, airport index)
+    """
+    import api_code
+
+    def invoke(i, body):
+        start = time.perf_counter()
+        result = api_code.lambda_handler({"body": json.dumps(body)}, BenchContext(f"{name}-{i}"))
+        return (time.perf_counter() - start) * 1000, result.get('statusCode', 200)
+
+    # the lambda logs a lot, keep it out of the benchmark output
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for i, body in enumerate(scenario_bodies(name, warmup, seed=1)):
+            invoke(-i - 1, body)
+        before = upstream_stats()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(invoke, range(requests), scenario_bodies(name, requests)))
+        wall = time.perf_counter() - started
+        after = upstream_stats()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    latencies = sorted(ms for ms, _ in results)
+    upstream = {}
+    for provider in PROVIDERS:
+        diff = {key: after[provider][key] - before[provider][key] for key in after[provider]}
+        diff["calls_per_request"] = round(diff["calls"] / requests, 3) if requests else 0
+        upstream[provider] = diff
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, status in results if status != 200),
+        "throughput_rps": round(requests / wall, 2) if wall else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(latencies[-1], 2) if latencies else None,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "upstream": upstream,
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(list(SCENARIOS) + ['mix']))
+    parser.add_argument('--requests', type=int, default=30, help="measured requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=200, help="median upstream latency")
+    parser.add_argument('--jitter', type=float, default=0.35, help="lognormal sigma of upstream latency")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    for provider in PROVIDERS:
+        parser.add_argument(f'--{provider}-ms', type=float, help=f"median latency of the {provider} stub")
+    parser.add_argument('--items', type=int, default=20, help="flights / hotel properties per search")
+    parser.add_argument('--images', type=int, default=10, help="images and nearby places per property")
+    parser.add_argument('--cache', action='store_true', help="leave the SerpAPI result cache on")
+    parser.add_argument('--in-process', action='store_true', help="run every scenario in this process")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_scenario(args.child, args.requests, args.concurrency, args.warmup)
+        with open(args.result_file, 'w', encoding='utf-8') as file:
+            json.dump(result, file)
+        return
+
+    configs = {
+        provider: StubConfig(
+            latency_ms=getattr(args, f'{provider}_ms') if getattr(args, f'{provider}_ms') is not None else args.latency_ms,
+            jitter=args.jitter, error_rate=args.error_rate, items=args.items, images=args.images
+        )
+        for provider in PROVIDERS
+    }
+    stubs = start_stubs(configs)
+    env = {
+        **stub_env(stubs),
+        "OPENAI_API_KEY": "bench", "PERPLEXITY_API_KEY": "bench", "SERPAI_API_KEY": "bench",
+        "SEARCH_CACHE_ENABLED": "true" if args.cache else "false",
+    }
+    os.environ.update(env)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ('child', 'result_file', 'output')},
+        "scenarios": {}
+    }
+    try:
+        for name in args.scenarios.split(','):
+            print(f"running {name}...", file=sys.stderr)
+            if args.in_process:
+                results["scenarios"][name] = run_scenario(name, args.requests, args.concurrency, args.warmup)
+                continue
+            result_file = os.path.join(BENCH_DIR, f".bench-{os.getpid()}-{name}.json")
+            command = [
+                sys.executable, os.path.abspath(__file__), '--child', name, '--result-file', result_file,
+                '--requests', str(args.requests), '--concurrency', str(args.concurrency), '--warmup', str(args.warmup)
+            ]
+            subprocess.run(command, check=True, cwd=ROOT_DIR, env={**os.environ, **env})
+            with open(result_file, encoding='utf-8') as file:
+                results["scenarios"][name] = json.load(file)
+            os.remove(result_file)
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
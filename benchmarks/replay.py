@@ -0,0 +1,155 @@
+"""
+Replay recorded cassettes (see cassettes.py) through lambda_handler with the upstream
+providers answered from the recordings, at N x the recorded upstream speed and with
+many invocations in flight.
+
+Reports latency and, per provider, recorded vs replayed upstream calls and bytes, and
+flags any increase: calls the recording never made, more calls, or bigger requests.
+Pass a previous --output file as --baseline to compare two commits instead.
+
+Usage:
+    CASSETTE_RECORD_DIR=/tmp/cassettes ...   # record, on the lambda or locally
+    python benchmarks/replay.py /tmp/cassettes [--speed 10] [--concurrency 8] [--repeat 3]
+        [--output replay.json] [--baseline previous.json] [--fail-on-increase]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from offline_bench import BenchContext, git_commit, peak_rss_mb, percentile
+
+def cassette_paths(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.json.gz'))
+        else:
+            found.append(path)
+    return found
+
+def add_counts(total, counts):
+    for provider, stats in counts.items():
+        provider_total = total.setdefault(provider, {})
+        for key, value in stats.items():
+            provider_total[key] = provider_total.get(key, 0) + value
+
+def find_increases(current, reference, tolerance, label):
+    """
+    Function to list where the replayed traffic grew compared with a reference.
+
+    @PARAMS:
+        - current   -> {provider: counts} of this replay
+        - reference -> {provider: {"calls", "bytes_out", "bytes_in"}} to compare against
+        - tolerance -> allowed relative growth in bytes
+        - label     -> 'recording' or 'baseline', for the messages
+    """
+    increases = []
+    for provider, stats in current.items():
+        before = reference.get(provider, {"calls": 0, "bytes_out": 0, "bytes_in": 0})
+        if stats["calls"] > before["calls"]:
+            increases.append(f"{provider}: {stats['calls']} calls vs {before['calls']} in the {label}")
+        for field in ("bytes_out", "bytes_in"):
+            if stats[field] > before[field] * (1 + tolerance):
+                increases.append(f"{provider}: {field} {stats[field]} vs {before[field]} in the {label}")
+    return increases
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help="cassette files or directories of them")
+    parser.add_argument('--speed', type=float, default=1.0, help="replay upstream latency N x faster, 0 for none")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=1, help="replay every cassette this many times")
+    parser.add_argument('--bytes-tolerance', type=float, default=0.05, help="allowed relative growth in bytes")
+    parser.add_argument('--baseline', help="a previous --output file to compare against")
+    parser.add_argument('--fail-on-increase', action='store_true', help="exit 1 if upstream traffic grew")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # the recordings hold REDACTED in place of the keys, use it live too so exact matches hold
+    os.environ.update({
+        "OPENAI_API_KEY": "REDACTED", "PERPLEXITY_API_KEY": "REDACTED", "SERPAI_API_KEY": "REDACTED",
+        "SEARCH_CACHE_ENABLED": "false", "CASSETTE_RECORD_DIR": ""
+    })
+    import api_code
+    from cassettes import ReplayPlayer, install_replay, load_cassette, play
+    install_replay(api_code.get_session, api_code.PROVIDER_URLS)
+
+    cassettes = [(path, load_cassette(path)) for path in cassette_paths(args.paths)]
+    if not cassettes:
+        parser.error("no cassettes found")
+    jobs = [(path, cassette) for _ in range(args.repeat) for path, cassette in cassettes]
+
+    def replay(job):
+        path, cassette = job
+        player = ReplayPlayer(cassette, speed=args.speed)
+        start = time.perf_counter()
+        result = play(player, api_code.lambda_handler, {"body": cassette["event_body"]}, BenchContext(f"replay-{cassette['request_id']}"))
+        return path, (time.perf_counter() - start) * 1000, result.get('statusCode', 200), player.report()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            replays = list(pool.map(replay, jobs))
+        wall = time.perf_counter() - started
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    totals = {}
+    per_cassette = {}
+    for path, _, _, counts in replays:
+        add_counts(totals, counts)
+        add_counts(per_cassette.setdefault(os.path.basename(path), {}), counts)
+    replayed = {provider: {"calls": stats["replayed_calls"], "bytes_out": stats["replayed_bytes_out"], "bytes_in": stats["replayed_bytes_in"]}
+                for provider, stats in totals.items()}
+    recorded = {provider: {"calls": stats["recorded_calls"], "bytes_out": stats["recorded_bytes_out"], "bytes_in": stats["recorded_bytes_in"]}
+                for provider, stats in totals.items()}
+
+    increases = find_increases(replayed, recorded, args.bytes_tolerance, "recording")
+    increases += [f"{provider}: {stats['extra_calls']} calls with no recorded response"
+                  for provider, stats in totals.items() if stats["extra_calls"]]
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        increases += find_increases(replayed, baseline.get("replayed", {}), args.bytes_tolerance, "baseline")
+
+    latencies = sorted(ms for _, ms, _, _ in replays)
+    results = {
+        "commit": git_commit(),
+        "cassettes": len(cassettes),
+        "invocations": len(replays),
+        "speed": args.speed,
+        "concurrency": args.concurrency,
+        "errors": sum(1 for _, _, status, _ in replays if status != 200),
+        "throughput_rps": round(len(replays) / wall, 2) if wall else None,
+        "latency_ms": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99)},
+        "peak_rss_mb": peak_rss_mb(),
+        "recorded": recorded,
+        "replayed": replayed,
+        "providers": totals,
+        "per_cassette": per_cassette,
+        "increases": increases,
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    if increases:
+        print("Upstream traffic increased:\n  " + "\n  ".join(increases), file=sys.stderr)
+        if args.fail_on_increase:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
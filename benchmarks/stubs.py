@@ -0,0 +1,317 @@
+"""
+Local stand-ins for the OpenAI, Perplexity and SerpAPI endpoints used by api_code.py.
+Each provider runs its own threaded HTTP server with a configurable latency distribution,
+error rate and payload size, and counts the calls and bytes it served.
+
+Point the lambda at them with the env vars from stub_env() before importing api_code.
+Every stub also answers GET /__stats with its counters, so a benchmark running in another
+process can diff them around a scenario.
+"""
+
+import re
+import json
+import time
+import random
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PROVIDERS = ('openai', 'perplexity', 'serpapi')
+PROVIDER_PATHS = {
+    "openai": "/v1/chat/completions",
+    "perplexity": "/chat/completions",
+    "serpapi": "/search",
+}
+IATA_RE = re.compile(r'\b([A-Z]{3})\b')
+PLACE_RE = re.compile(r'\b(?:in|to)\s+([A-Z][a-z]+)')
+
+class StubConfig:
+    """
+    Behaviour of one stub provider.
+
+    @PARAMS:
+        - latency_ms -> median response latency
+        - jitter     -> sigma of the lognormal latency distribution, 0 for a fixed latency
+        - error_rate -> share of requests answered with a 500
+        - items      -> flights / properties per SerpAPI search
+        - images     -> images and nearby places per hotel property
+        - pages      -> pages of hotel results reachable through next_page_token
+    """
+
+    def __init__(self, latency_ms=200.0, jitter=0.35, error_rate=0.0, items=20, images=10, pages=3):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.items = items
+        self.images = images
+        self.pages = pages
+
+    def delay(self, rng):
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.latency_ms * (rng.lognormvariate(0, self.jitter) if self.jitter else 1.0) / 1000
+
+def trip_dates():
+    """
+    Function to get check-in/out dates a month out, so searches are always in the future.
+    """
+    start = date.today() + timedelta(days=30)
+    return start.isoformat(), (start + timedelta(days=3)).isoformat()
+
+def request_plan(query):
+    """
+    Function to answer the single-call extraction with a plan that matches the query's keywords.
+
+    @PARAMS:
+        - query -> the user query the lambda sent
+    """
+    lower = query.lower()
+    codes = IATA_RE.findall(query)
+    places = PLACE_RE.findall(query)
+    destination = places[-1] if places else "Paris"
+    outbound, back = trip_dates()
+    wants_flight = 'flight' in lower or 'fly' in lower or 'trip' in lower
+    wants_hotel = 'hotel' in lower or 'stay' in lower or 'trip' in lower
+    budget = re.search(r'\$\s?[\d,]+', query)
+    return {
+        "query": query,
+        "flight": f"Find flights to {destination}" if wants_flight else None,
+        "hotel": f"Find hotels in {destination}" if wants_hotel else None,
+        "budget": budget.group(0) if budget else None,
+        "questions": query if '?' in query or 'trip' in lower else None,
+        "notes": None,
+        "conversation_summary": None,
+        "flight_params": {
+            "departure_id": codes[0] if codes else "JFK",
+            "arrival_id": codes[1] if len(codes) > 1 else "CDG",
+            "outbound_date": outbound,
+            "return_date": None,
+            "type": 2,
+            "adults": None
+        } if wants_flight else None,
+        "hotel_params": {
+            "q": destination,
+            "check_in_date": outbound,
+            "check_out_date": back,
+            "adults": 2
+        } if wants_hotel else None
+    }
+
+def openai_answer(body):
+    """
+    Function to answer a chat completion the way the lambda's prompts expect.
+    """
+    texts = [part.get('text', '') for message in body.get('messages', [])
+             for part in (message['content'] if isinstance(message.get('content'), list) else [{"text": message.get('content', '')}])]
+    prompt = texts[-1] if texts else ''
+    everything = ' '.join(texts)
+    outbound, back = trip_dates()
+    if body.get('response_format'):
+        return json.dumps(request_plan(prompt.replace('Current user query:', '').strip()))
+    if 'flight search assistant' in everything:
+        return json.dumps({"departure_id": "JFK", "arrival_id": "CDG", "outbound_date": outbound, "type": 2})
+    if 'hotel search assistant' in everything:
+        return json.dumps({"q": "Paris", "check_in_date": outbound, "check_out_date": back, "adults": 2})
+    if 'travel assistant' in everything:
+        return json.dumps({key: value for key, value in request_plan(prompt).items()
+                           if key in ('flight', 'hotel', 'budget', 'questions', 'notes') and value})
+    return "Here is a short answer about your trip. " * 8
+
+def flight_option(rng, i):
+    return {
+        "flights": [{
+            "departure_airport": {"name": "John F. Kennedy International Airport", "id": "JFK", "time": "2026-11-03 08:00"},
+            "arrival_airport": {"name": "Paris Charles de Gaulle Airport", "id": "CDG", "time": "2026-11-03 20:00"},
+            "duration": 420 + i, "airplane": "Airbus A350", "airline": "Air France",
+            "airline_logo": "https://www.gstatic.com/flights/airline_logos/70px/AF.png",
+            "travel_class": "Economy", "flight_number": f"AF {i:03d}", "legroom": "31 in",
+            "extensions": ["Average legroom (31 in)", "Wi-Fi for a fee", "In-seat power & USB outlets"],
+            "ticket_also_sold_by": ["Delta"], "plane_and_crew_by": "Air France"
+        }],
+        "layovers": [],
+        "total_duration": 420 + i,
+        "carbon_emissions": {"this_flight": 410000, "typical_for_this_route": 400000, "difference_percent": 2},
+        "price": rng.randint(300, 1500),
+        "type": "One way",
+        "airline_logo": "https://www.gstatic.com/flights/airline_logos/70px/AF.png",
+        "extensions": ["Checked baggage for a fee"],
+        "booking_token": "x" * 200
+    }
+
+def hotel_property(rng, i, images):
+    rate = rng.randint(80, 600)
+    return {
+        "type": "hotel",
+        "name": f"Stub Hotel {i}",
+        "description": "A comfortable stub hotel close to everything. " * 3,
+        "link": f"https://example.com/hotel/{i}",
+        "gps_coordinates": {"latitude": 48.85 + i / 1000, "longitude": 2.35},
+        "check_in_time": "3:00 PM", "check_out_time": "11:00 AM",
+        "rate_per_night": {"lowest": f"${rate}", "extracted_lowest": rate},
+        "total_rate": {"lowest": f"${rate * 3}", "extracted_lowest": rate * 3},
+        "prices": [{"source": "Stub", "logo": "https://example.com/logo.png", "rate_per_night": {"lowest": f"${rate}"}}] * 4,
+        "nearby_places": [{"name": f"Place {n}", "transportations": [{"type": "Walking", "duration": "5 min"}]} for n in range(images)],
+        "hotel_class": f"{3 + i % 3}-star hotel", "extracted_hotel_class": 3 + i % 3,
+        "images": [{"thumbnail": f"https://example.com/t/{i}/{n}.jpg", "original_image": f"https://example.com/o/{i}/{n}.jpg"} for n in range(images)],
+        "overall_rating": round(3.5 + (i % 3) / 2, 1), "reviews": 100 + i,
+        "ratings": [{"stars": s, "count": 10 * s} for s in range(1, 6)],
+        "location_rating": 4.2,
+        "reviews_breakdown": [{"name": "Service", "description": "Service", "total_mentioned": 50, "positive": 40, "negative": 5, "neutral": 5}] * 4,
+        "amenities": ["Free Wi-Fi", "Pool", "Air conditioning"] if i % 2 else ["Free Wi-Fi"],
+        "property_token": f"token{i}",
+        "serpapi_property_details_link": f"https://serpapi.com/search.json?property_token=token{i}"
+    }
+
+def serpapi_answer(params, config, rng):
+    """
+    Function to build a SerpAPI-shaped result with config.items flights or properties.
+    """
+    engine = params.get('engine', 'google_flights')
+    result = {
+        "search_metadata": {
+            "id": f"stub-{rng.randint(0, 10 ** 9)}", "status": "Success", "total_time_taken": 1.2,
+            "json_endpoint": "https://serpapi.com/searches/stub.json",
+            "google_flights_url": "https://www.google.com/travel/flights?stub=1",
+            "google_hotels_url": "https://www.google.com/travel/hotels?stub=1",
+            "raw_html_file": "https://serpapi.com/searches/stub.html"
+        },
+        "search_parameters": {key: value for key, value in params.items() if key != 'api_key'},
+    }
+    if engine == 'google_hotels':
+        result["search_information"] = {"total_results": config.items * 10}
+        token = params.get('next_page_token', '')
+        page = int(token.rsplit('-', 1)[1]) if token.startswith('stub-page-') else 1
+        first = (page - 1) * config.items
+        result["properties"] = [hotel_property(rng, first + i, config.images) for i in range(config.items)]
+        result["serpapi_pagination"] = {"current_from": first + 1, "current_to": first + config.items}
+        if page < config.pages:
+            result["serpapi_pagination"]["next_page_token"] = f"stub-page-{page + 1}"
+        result["brands"] = [{"id": i, "name": f"Brand {i}"} for i in range(50)]
+    else:
+        options = [flight_option(rng, i) for i in range(config.items)]
+        result["best_flights"] = options[:3]
+        result["other_flights"] = options[3:]
+        result["price_insights"] = {"lowest_price": min(o["price"] for o in options), "price_level": "typical",
+                                    "price_history": [[1700000000 + day * 86400, 500 + day] for day in range(60)]}
+    return result
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.handle_request(json.loads(self.rfile.read(length) or b'{}'))
+
+    def handle_request(self, body):
+        stub = self.server.stub
+        parsed = urlparse(self.path)
+        if parsed.path == '/__stats':
+            return self.send(200, json.dumps(stub.stats()).encode(), 'application/json')
+
+        rng = random.Random()
+        time.sleep(stub.config.delay(rng))
+        if rng.random() < stub.config.error_rate:
+            payload = json.dumps({"error": {"message": "stub upstream error"}}).encode()
+            stub.count(len(self.path) + len(json.dumps(body or {})), len(payload), error=True)
+            return self.send(500, payload, 'application/json')
+
+        content_type = 'application/json'
+        if stub.provider == 'serpapi':
+            params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            payload = json.dumps(serpapi_answer(params, stub.config, rng)).encode()
+        elif stub.provider == 'openai':
+            answer = openai_answer(body)
+            if body.get('stream'):
+                words = answer.split(' ')
+                chunks = [f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n" for word in words]
+                payload = (''.join(chunks) + "data: [DONE]\n\n").encode()
+                content_type = 'text/event-stream'
+            else:
+                payload = json.dumps({"choices": [{"message": {"content": answer}}]}).encode()
+        else:
+            answer = "Stub answer with a few practical travel tips for your destination. " * 6
+            citations = ["https://example.com/guide", "https://example.com/tips"]
+            if body.get('stream'):
+                chunks = [f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}], 'citations': citations})}\n\n"
+                          for word in answer.split(' ')]
+                payload = ''.join(chunks).encode()
+                content_type = 'text/event-stream'
+            else:
+                payload = json.dumps({"choices": [{"message": {"content": answer}}], "citations": citations}).encode()
+
+        stub.count(len(self.path) + len(json.dumps(body or {})), len(payload))
+        self.send(200, payload, content_type)
+
+    def send(self, status, payload, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+class StubProvider:
+    """
+    One provider's stub server, running on a daemon thread.
+    """
+
+    def __init__(self, provider, config, host='127.0.0.1', port=0):
+        self.provider = provider
+        self.config = config
+        self.server = ThreadingHTTPServer((host, port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{PROVIDER_PATHS[self.provider]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, bytes_in, bytes_out, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+def start_stubs(configs):
+    """
+    Function to start a stub server per provider.
+
+    @PARAMS:
+        - configs -> {provider: StubConfig}
+    """
+    return {provider: StubProvider(provider, configs[provider]).start() for provider in PROVIDERS}
+
+def stub_env(stubs):
+    """
+    Function to get the env vars that point api_code at the stubs.
+
+    @PARAMS:
+        - stubs -> the dict returned by start_stubs
+    """
+    return {f"{provider.upper()}_URL": stub.url for provider, stub in stubs.items()}
@@ -0,0 +1,297 @@
+"""
+Per-provider circuit breakers. Each breaker keeps a rolling window of call outcomes and
+latencies, opens when too many calls fail or are slow, and after a cool-down lets a few
+probe calls through (half-open) to decide whether to close again.
+State lives for the life of the warm container and, with BREAKER_STORE_PATH set, is
+shared through a SQLite file so other containers on the same volume skip a provider
+one of them has already seen fail.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from deadlines import DeadlineExceeded
+from telemetry import emit_metrics
+
+BREAKER_ENABLED = os.environ.get('BREAKER_ENABLED', 'true').lower() == 'true'
+# outcomes older than this drop out of the error and slow-call rates
+BREAKER_WINDOW_SECONDS = float(os.environ.get('BREAKER_WINDOW_SECONDS', '60'))
+# calls needed in the window before the rates can open the breaker
+BREAKER_MIN_CALLS = int(os.environ.get('BREAKER_MIN_CALLS', '10'))
+BREAKER_ERROR_RATE = float(os.environ.get('BREAKER_ERROR_RATE', '0.5'))
+# a call slower than this counts towards the slow-call rate
+BREAKER_SLOW_CALL_MS = float(os.environ.get('BREAKER_SLOW_CALL_MS', '8000'))
+BREAKER_SLOW_RATE = float(os.environ.get('BREAKER_SLOW_RATE', '0.8'))
+# how long an open breaker rejects calls before it lets probes through
+BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', '30'))
+# probes allowed in flight while half-open, and successes needed to close
+BREAKER_PROBE_CALLS = int(os.environ.get('BREAKER_PROBE_CALLS', '1'))
+BREAKER_PROBE_SUCCESSES = int(os.environ.get('BREAKER_PROBE_SUCCESSES', '2'))
+# optional SQLite file shared by containers, e.g. on EFS
+BREAKER_STORE_PATH = os.environ.get('BREAKER_STORE_PATH', '')
+# how often a breaker re-reads the shared store
+BREAKER_STORE_REFRESH_SECONDS = float(os.environ.get('BREAKER_STORE_REFRESH_SECONDS', '2'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+# published as the BreakerState metric
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+class SQLiteBreakerStore:
+    """
+    Shared breaker state, one row per provider with the state and when it last changed.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        import sqlite3
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS breakers (name TEXT PRIMARY KEY, state TEXT, changed_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, changed_at FROM breakers WHERE name = ?", (name,)
+            ).fetchone()
+        return row
+
+    def set(self, name, state, changed_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO breakers (name, state, changed_at) VALUES (?, ?, ?)",
+                (name, state, changed_at)
+            )
+            self._conn.commit()
+
+def get_breaker_store():
+    """
+    Function to get the shared store, None when BREAKER_STORE_PATH isn't set or can't be opened.
+    """
+    global _STORE
+    if not BREAKER_STORE_PATH:
+        return None
+    with _STORE_LOCK:
+        if _STORE is None:
+            try:
+                _STORE = SQLiteBreakerStore(BREAKER_STORE_PATH)
+            except Exception as e:
+                print(f"Error opening breaker store, keeping breakers local: {str(e)}")
+                return None
+        return _STORE
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream provider.
+
+    @PARAMS:
+        - name  -> the provider name, also the metric stage suffix
+        - store -> optional shared store, see SQLiteBreakerStore
+    """
+
+    def __init__(self, name, store=None):
+        self.name = name
+        self.store = store
+        self.state = CLOSED
+        # wall clock, so it compares across containers through the store
+        self.changed_at = time.time()
+        self.outcomes = deque()
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "probes": 0, "opened": 0}
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self.outcomes and self.outcomes[0][0] < now - BREAKER_WINDOW_SECONDS:
+            self.outcomes.popleft()
+
+    def _transition(self, state, now, publish=True):
+        """
+        Moves to a new state, must hold the lock.
+        """
+        previous = self.state
+        self.state = state
+        self.changed_at = now
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        if state == OPEN:
+            self.stats["opened"] += 1
+        if state == CLOSED:
+            self.outcomes.clear()
+        print(f"Circuit breaker {self.name}: {previous} -> {state}")
+        emit_metrics(f"breaker.{self.name}", {"BreakerState": STATE_VALUES[state]}, {"provider": self.name, "state": state, "previous": previous})
+        if publish and self.store is not None:
+            try:
+                self.store.set(self.name, state, now)
+            except Exception as e:
+                print(f"Error writing breaker state: {str(e)}")
+
+    def _sync(self, now):
+        """
+        Adopts a newer state written by another container, must hold the lock.
+        """
+        if self.store is None or now - self._synced_at < BREAKER_STORE_REFRESH_SECONDS:
+            return
+        self._synced_at = now
+        try:
+            row = self.store.get(self.name)
+        except Exception as e:
+            print(f"Error reading breaker state: {str(e)}")
+            return
+        if row is not None and row[1] > self.changed_at and row[0] != self.state:
+            self._transition(row[0], row[1], publish=False)
+
+    def _current(self, now):
+        """
+        The state after any cool-down has run out, must hold the lock.
+        """
+        self._sync(now)
+        if self.state == OPEN and now - self.changed_at >= BREAKER_OPEN_SECONDS:
+            self._transition(HALF_OPEN, now)
+        return self.state
+
+    def allow(self):
+        """
+        Function to ask whether a call may go to this provider now.
+        Always true while closed, false while open, and true for up to
+        BREAKER_PROBE_CALLS calls in flight while half-open.
+        """
+        if not BREAKER_ENABLED:
+            return True
+        with self._lock:
+            state = self._current(time.time())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self.probes_in_flight < BREAKER_PROBE_CALLS:
+                self.probes_in_flight += 1
+                self.stats["probes"] += 1
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def available(self):
+        """
+        Function to check the provider isn't open, without taking a probe slot.
+        """
+        if not BREAKER_ENABLED:
+            return True
+        with self._lock:
+            return self._current(time.time()) != OPEN
+
+    def record(self, success, duration_ms):
+        """
+        Function to record how a call went.
+
+        @PARAMS:
+            - success     -> False for an exception, an error status or an unusable answer
+            - duration_ms -> how long the call took
+        """
+        if not BREAKER_ENABLED:
+            return
+        slow = duration_ms >= BREAKER_SLOW_CALL_MS
+        now = time.time()
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += 0 if success else 1
+            self.stats["slow_calls"] += 1 if slow else 0
+            state = self._current(now)
+
+            if state == HALF_OPEN:
+                self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+                if not success or slow:
+                    self._transition(OPEN, now)
+                    return
+                self.probe_successes += 1
+                if self.probe_successes >= BREAKER_PROBE_SUCCESSES:
+                    self._transition(CLOSED, now)
+                return
+
+            # a call that started before the breaker opened says nothing new
+            if state == OPEN:
+                return
+
+            self.outcomes.append((now, success, slow))
+            self._trim(now)
+            calls = len(self.outcomes)
+            if calls < BREAKER_MIN_CALLS:
+                return
+            error_rate = sum(1 for _, ok, _ in self.outcomes if not ok) / calls
+            slow_rate = sum(1 for _, _, is_slow in self.outcomes if is_slow) / calls
+            if error_rate >= BREAKER_ERROR_RATE or slow_rate >= BREAKER_SLOW_RATE:
+                print(f"Circuit breaker {self.name}: error rate {error_rate:.0%}, slow rate {slow_rate:.0%} over {calls} calls")
+                self._transition(OPEN, now)
+
+    def release(self):
+        """
+        Function to hand back a probe slot for a call that never reached the provider.
+        """
+        with self._lock:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+
+    @contextmanager
+    def track(self):
+        """
+        Context manager that records the outcome of the call made in the block.
+        Exceptions count as failures and are re-raised; running out of our own
+        deadline isn't the provider's fault and isn't counted.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except DeadlineExceeded:
+            self.release()
+            raise
+        except Exception:
+            self.record(False, (time.perf_counter() - started) * 1000)
+            raise
+        self.record(True, (time.perf_counter() - started) * 1000)
+
+    def snapshot(self):
+        with self._lock:
+            state = self._current(time.time())
+            self._trim(time.time())
+            calls = len(self.outcomes)
+            return {
+                "state": state,
+                "since": self.changed_at,
+                "window_calls": calls,
+                "window_error_rate": round(sum(1 for _, ok, _ in self.outcomes if not ok) / calls, 3) if calls else 0.0,
+                "window_slow_rate": round(sum(1 for _, _, slow in self.outcomes if slow) / calls, 3) if calls else 0.0,
+                **self.stats
+            }
+
+def get_breaker(name):
+    """
+    Function to get the container's breaker for a provider, created on first use.
+
+    @PARAMS:
+        - name -> the provider name
+    """
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = _BREAKERS[name] = CircuitBreaker(name, get_breaker_store())
+        return breaker
+
+def get_breaker_stats():
+    """
+    Function to get the state and counters of every breaker in this container.
+    """
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -0,0 +1,301 @@
+"""
+Record/replay of upstream traffic. With CASSETTE_RECORD_DIR set, every lambda invocation
+writes a gzipped cassette holding the request body and each OpenAI, Perplexity and SerpAPI
+request/response pair it triggered, with the api keys redacted.
+ReplayPlayer and ReplayAdapter feed a cassette back through the real code path, see
+benchmarks/replay.py.
+"""
+
+import io
+import os
+import json
+import gzip
+import time
+import random
+import hashlib
+import threading
+import contextvars
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+CASSETTE_RECORD_DIR = os.environ.get('CASSETTE_RECORD_DIR', '')
+# share of invocations recorded when CASSETTE_RECORD_DIR is set
+CASSETTE_SAMPLE_RATE = float(os.environ.get('CASSETTE_SAMPLE_RATE', '1.0'))
+SECRET_ENV_VARS = ('PERPLEXITY_API_KEY', 'OPENAI_API_KEY', 'SERPAI_API_KEY')
+SECRET_PARAMS = {'api_key', 'key', 'token'}
+REDACTED = 'REDACTED'
+
+_RECORDING = contextvars.ContextVar('traveler_cassette', default=None)
+_PLAYER = contextvars.ContextVar('traveler_replay', default=None)
+
+def redact(text):
+    """
+    Function to blank out the configured api keys wherever they appear in a string.
+    """
+    for name in SECRET_ENV_VARS:
+        secret = os.environ.get(name, '')
+        # short values are placeholders, replacing them would mangle unrelated text
+        if len(secret) >= 8 and secret != REDACTED:
+            text = text.replace(secret, REDACTED)
+    return text
+
+def redact_url(url):
+    """
+    Function to drop the secret query params from a url.
+    """
+    parts = urlsplit(url)
+    query = [(key, REDACTED if key in SECRET_PARAMS else value) for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+    return redact(parts._replace(query=urlencode(query)).geturl())
+
+def request_body_text(request):
+    body = request.body or b''
+    return body.decode('utf-8', 'replace') if isinstance(body, bytes) else str(body)
+
+def request_keys(provider, method, url, body_text):
+    """
+    Function to get the exact and loose match keys of an upstream request.
+    The exact key covers the whole redacted request, the loose key only what kind of call
+    it is (engine, structured output, streaming) so replays survive prompt or date changes.
+
+    @PARAMS:
+        - provider  -> the provider name
+        - method    -> the http method
+        - url       -> the url, redacted or not
+        - body_text -> the request body as text
+    """
+    parts = urlsplit(url)
+    params = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key not in SECRET_PARAMS)
+    body_text = redact(body_text)
+    exact = hashlib.sha1(json.dumps([provider, method, parts.path, params, body_text]).encode('utf-8')).hexdigest()
+
+    try:
+        body = json.loads(body_text) if body_text else {}
+    except ValueError:
+        body = {}
+    kind = [provider, method, parts.path, dict(params).get('engine', '')]
+    if isinstance(body, dict):
+        kind += [bool(body.get('stream')), bool(body.get('response_format'))]
+    return exact, '|'.join(str(part) for part in kind)
+
+class Cassette:
+    """
+    The upstream interactions of one invocation, in the order they completed.
+    """
+
+    def __init__(self, request_id, event_body):
+        self.request_id = request_id
+        self.event_body = event_body
+        self.recorded_at = datetime.now(timezone.utc).isoformat()
+        self.started = time.perf_counter()
+        self.interactions = []
+        self._lock = threading.Lock()
+
+    def add(self, interaction):
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def to_dict(self):
+        with self._lock:
+            interactions = list(self.interactions)
+        return {
+            "request_id": self.request_id,
+            "recorded_at": self.recorded_at,
+            "event_body": redact(self.event_body or ''),
+            "interactions": interactions
+        }
+
+def start_recording(request_id, event_body):
+    """
+    Function to start a cassette for this invocation if recording is on and it is sampled in.
+
+    @PARAMS:
+        - request_id -> the lambda request id
+        - event_body -> the raw API Gateway body, holds the prompt and conversation history
+    """
+    if not CASSETTE_RECORD_DIR or random.random() >= CASSETTE_SAMPLE_RATE:
+        return None
+    cassette = Cassette(request_id, event_body)
+    _RECORDING.set(cassette)
+    return cassette
+
+def is_recording():
+    return _RECORDING.get() is not None
+
+def record_interaction(provider, response, elapsed_ms):
+    """
+    Function to add an upstream response to the current cassette.
+    The body is read in full so it can be stored, the response gets an in-memory copy of it
+    to keep working for streamed callers.
+
+    @PARAMS:
+        - provider   -> the provider name
+        - response   -> the requests response
+        - elapsed_ms -> time until the response headers arrived
+    """
+    cassette = _RECORDING.get()
+    if cassette is None:
+        return response
+    content = response.content
+    response.raw = io.BytesIO(content)
+    request = response.request
+    cassette.add({
+        "provider": provider,
+        "method": request.method,
+        "url": redact_url(request.url),
+        "request_body": redact(request_body_text(request)),
+        "status": response.status_code,
+        "content_type": response.headers.get('Content-Type', 'application/json'),
+        "response_body": redact(content.decode('utf-8', 'replace')),
+        "elapsed_ms": round(elapsed_ms, 2),
+        "offset_ms": round((time.perf_counter() - cassette.started) * 1000 - elapsed_ms, 2)
+    })
+    return response
+
+def finish_recording():
+    """
+    Function to write the current cassette to CASSETTE_RECORD_DIR, returns the file path.
+    """
+    cassette = _RECORDING.get()
+    if cassette is None:
+        return None
+    _RECORDING.set(None)
+    try:
+        os.makedirs(CASSETTE_RECORD_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        path = os.path.join(CASSETTE_RECORD_DIR, f"{stamp}-{cassette.request_id}.json.gz")
+        with gzip.open(path, 'wt', encoding='utf-8') as file:
+            json.dump(cassette.to_dict(), file)
+        return path
+    except OSError as e:
+        print(f"Error writing cassette: {str(e)}")
+        return None
+
+def load_cassette(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        return json.load(file)
+
+class ReplayPlayer:
+    """
+    Serves one cassette's recorded responses and counts how the replayed traffic
+    compares with what was recorded.
+
+    @PARAMS:
+        - cassette -> the dict from load_cassette
+        - speed    -> replay the recorded upstream latency this many times faster, 0 for no wait
+    """
+
+    def __init__(self, cassette, speed=1.0):
+        self.cassette = cassette
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._unused = []
+        for interaction in cassette.get('interactions', []):
+            exact, loose = request_keys(interaction['provider'], interaction['method'], interaction['url'], interaction['request_body'])
+            self._unused.append((exact, loose, interaction))
+        self.stats = {}
+
+    def _count(self, provider, field, value=1, stats=None):
+        stats = self.stats if stats is None else stats
+        provider_stats = stats.setdefault(provider, {
+            "recorded_calls": 0, "replayed_calls": 0, "extra_calls": 0, "unused_calls": 0,
+            "recorded_bytes_out": 0, "replayed_bytes_out": 0, "recorded_bytes_in": 0, "replayed_bytes_in": 0
+        })
+        provider_stats[field] += value
+
+    def respond(self, provider, request):
+        """
+        Function to find the recorded response for a live request.
+        Exact matches win, then the first unused call of the same kind, otherwise the
+        call is new to this code and gets a 599.
+        """
+        body_text = request_body_text(request)
+        exact, loose = request_keys(provider, request.method, request.url, body_text)
+        with self._lock:
+            match = next((entry for entry in self._unused if entry[0] == exact), None)
+            if match is None:
+                match = next((entry for entry in self._unused if entry[1] == loose), None)
+            if match is not None:
+                self._unused.remove(match)
+            self._count(provider, "replayed_calls")
+            self._count(provider, "replayed_bytes_out", len(request.url) + len(body_text))
+            if match is None:
+                self._count(provider, "extra_calls")
+
+        if match is None:
+            return 599, 'application/json', json.dumps({"error": "no recorded response for this call"})
+        interaction = match[2]
+        if self.speed:
+            time.sleep(interaction.get('elapsed_ms', 0) / 1000 / self.speed)
+        with self._lock:
+            self._count(provider, "replayed_bytes_in", len(interaction['response_body']))
+        return interaction['status'], interaction['content_type'], interaction['response_body']
+
+    def report(self):
+        """
+        Function to get recorded vs replayed calls and bytes per provider.
+        """
+        with self._lock:
+            stats = {provider: dict(counts) for provider, counts in self.stats.items()}
+            unused = [interaction for _, _, interaction in self._unused]
+        for interaction in self.cassette.get('interactions', []):
+            provider = interaction['provider']
+            self._count(provider, "recorded_calls", stats=stats)
+            self._count(provider, "recorded_bytes_out", len(interaction['url']) + len(interaction['request_body']), stats=stats)
+            self._count(provider, "recorded_bytes_in", len(interaction['response_body']), stats=stats)
+        for interaction in unused:
+            self._count(interaction['provider'], "unused_calls", stats=stats)
+        return stats
+
+class ReplayAdapter(BaseAdapter):
+    """
+    requests adapter that answers from the ReplayPlayer bound to the current context.
+    Mount one per provider session, see install_replay.
+    """
+
+    def __init__(self, provider):
+        super().__init__()
+        self.provider = provider
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        player = _PLAYER.get()
+        if player is None:
+            status, content_type, body = 599, 'application/json', json.dumps({"error": "no cassette is being replayed"})
+        else:
+            status, content_type, body = player.respond(self.provider, request)
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({"Content-Type": content_type})
+        response.raw = io.BytesIO(body.encode('utf-8'))
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+def install_replay(get_session, providers):
+    """
+    Function to route the given providers' pooled sessions to the replay adapter.
+
+    @PARAMS:
+        - get_session -> api_code.get_session
+        - providers   -> the provider names
+    """
+    for provider in providers:
+        session = get_session(provider)
+        adapter = ReplayAdapter(provider)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+def play(player, fn, *args, **kwargs):
+    """
+    Function to run fn with player answering its upstream calls.
+    """
+    context = contextvars.copy_context()
+    context.run(_PLAYER.set, player)
+    return context.run(fn, *args, **kwargs)
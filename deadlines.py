@@ -0,0 +1,144 @@
+"""
+Per-request deadline budget. lambda_handler starts a deadline from the time the invocation
+has left, each pipeline stage narrows it to its own slice, and every upstream call turns
+what is left into its read timeout, so a hung provider can only spend its stage's share.
+"""
+
+import os
+import time
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# used when the lambda context can't say how long is left (local runs, the async server)
+REQUEST_BUDGET_MS = int(os.environ.get('REQUEST_BUDGET_MS', '25000'))
+# kept back from the lambda's remaining time to build and return the response
+DEADLINE_MARGIN_MS = int(os.environ.get('DEADLINE_MARGIN_MS', '750'))
+# the most each stage may take, on top of the overall request deadline
+STAGE_BUDGETS_MS = {
+    stage: int(os.environ.get(f'{stage.upper()}_BUDGET_MS', default))
+    for stage, default in (
+        ("plan", 8000),
+        ("rewrite", 5000),
+        ("intent", 6000),
+        ("flight_params", 6000),
+        ("hotel_params", 6000),
+        ("search", 12000),
+        ("question", 12000),
+    )
+}
+
+_DEADLINE = contextvars.ContextVar('traveler_deadline', default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised instead of starting an upstream call once the budget is spent.
+    """
+
+class Deadline:
+    """
+    A point in time, on the monotonic clock, that work has to finish by.
+    """
+
+    def __init__(self, budget_ms, stage='request'):
+        self.stage = stage
+        self.expires_at = time.monotonic() + budget_ms / 1000
+
+    def remaining(self):
+        """
+        Seconds left, never negative.
+        """
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def narrow(self, budget_ms, stage):
+        """
+        Function to get a deadline for a sub-stage, no later than this one.
+        """
+        child = Deadline(budget_ms, stage)
+        child.expires_at = min(child.expires_at, self.expires_at)
+        return child
+
+def start_deadline(context=None):
+    """
+    Function to set the deadline for a new request and return it.
+
+    @PARAMS:
+        - context -> the lambda context, its remaining time wins over REQUEST_BUDGET_MS
+    """
+    budget_ms = REQUEST_BUDGET_MS
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        budget_ms = max(context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MS, 0)
+    deadline = Deadline(budget_ms)
+    _DEADLINE.set(deadline)
+    return deadline
+
+def clear_deadline():
+    """
+    Function to drop the deadline, for background work that outlives the request.
+    """
+    _DEADLINE.set(None)
+
+def current_deadline():
+    return _DEADLINE.get()
+
+def remaining():
+    """
+    Function to get the seconds left for the current stage, None outside a request.
+    """
+    deadline = _DEADLINE.get()
+    return deadline.remaining() if deadline is not None else None
+
+@contextmanager
+def stage_deadline(stage):
+    """
+    Context manager that narrows the current deadline to the stage's slice for the block.
+
+    @PARAMS:
+        - stage -> a STAGE_BUDGETS_MS key, unknown stages keep the current deadline
+    """
+    deadline = _DEADLINE.get()
+    budget_ms = STAGE_BUDGETS_MS.get(stage)
+    if budget_ms is None:
+        yield deadline
+        return
+    narrowed = deadline.narrow(budget_ms, stage) if deadline is not None else Deadline(budget_ms, stage)
+    token = _DEADLINE.set(narrowed)
+    try:
+        yield narrowed
+    finally:
+        _DEADLINE.reset(token)
+
+def budgeted(stage):
+    """
+    Decorator that runs every call of a function inside its stage's deadline slice.
+
+    @PARAMS:
+        - stage -> the STAGE_BUDGETS_MS key
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_deadline(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bounded_timeout(timeout):
+    """
+    Function to cap a requests (connect, read) timeout by the time left.
+    Raises DeadlineExceeded when nothing is left, so the call is never started.
+
+    @PARAMS:
+        - timeout -> the provider's (connect, read) timeout in seconds
+    """
+    deadline = _DEADLINE.get()
+    if deadline is None:
+        return timeout
+    left = deadline.remaining()
+    if left <= 0:
+        raise DeadlineExceeded(f"deadline for {deadline.stage} exceeded")
+    connect, read = timeout
+    return (min(connect, left), min(read, left))
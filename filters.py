@@ -0,0 +1,266 @@
+"""
+Server-side filtering, sorting and paging of search results, with the same rules the
+frontend applies: FlightFilters in src/types/flight.ts (FlightDisplay.tsx) and HotelFilters
+in src/types/hotel.ts (HotelDisplay.tsx).
+The fields the filters read are pulled out of each option once and the index is kept per
+search result, so re-filtering a cached search only walks the index.
+"""
+
+import os
+import math
+import threading
+from collections import OrderedDict
+
+FILTER_PAGE_SIZE = int(os.environ.get('FILTER_PAGE_SIZE', '10'))
+FILTER_MAX_PAGE_SIZE = int(os.environ.get('FILTER_MAX_PAGE_SIZE', '50'))
+FILTER_INDEX_MAX_ENTRIES = int(os.environ.get('FILTER_INDEX_MAX_ENTRIES', '128'))
+# departureTime buckets, [start hour, end hour)
+DEPARTURE_TIMES = {"morning": (5, 12), "afternoon": (12, 17), "evening": (17, 21), "night": (21, 5)}
+# sort specs, a leading '-' reverses them
+FLIGHT_SORT_KEYS = ("price", "duration", "stops", "departure")
+HOTEL_SORT_KEYS = ("price", "rating", "stars", "reviews")
+# the type each FlightFilters / HotelFilters field must have
+FILTER_NUMBER_FIELDS = ("maxPrice", "maxDuration", "stops", "minReviewScore")
+FILTER_LIST_FIELDS = ("airlines", "starRating", "amenities", "nearbyLocations")
+FILTER_STRING_FIELDS = ("travelClass", "departureTime")
+FILTER_STATS = {"views": 0, "index_hits": 0, "index_builds": 0}
+
+_INDEXES = OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+
+def _departure_hour(option):
+    try:
+        return int(option['flights'][0]['departure_airport']['time'].split(' ')[1].split(':')[0])
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        return None
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def flight_index(flight_info):
+    """
+    Function to pull the filter and sort fields out of every flight option, in result order.
+    """
+    rows = []
+    for source in ('best_flights', 'other_flights'):
+        for option in flight_info.get(source) or []:
+            if not isinstance(option, dict) or not option.get('flights'):
+                continue
+            legs = option['flights']
+            rows.append({
+                "source": source,
+                "option": option,
+                "price": _number(option.get('price')),
+                "duration": _number(option.get('total_duration')),
+                "stops": len(legs) - 1,
+                "airlines": {leg.get('airline') for leg in legs},
+                "classes": {(leg.get('travel_class') or '').lower() for leg in legs if leg.get('travel_class')},
+                "departure": _departure_hour(option),
+                "departure_time": ((legs[0].get('departure_airport') or {}).get('time') or ''),
+            })
+    return rows
+
+def hotel_index(hotel_info):
+    """
+    Function to pull the filter and sort fields out of every property, in result order.
+    """
+    rows = []
+    for prop in hotel_info.get('properties') or []:
+        if not isinstance(prop, dict):
+            continue
+        stars = _number(prop.get('extracted_hotel_class'))
+        if stars is None and prop.get('hotel_class'):
+            digits = ''.join(c for c in str(prop['hotel_class']).split('-')[0] if c.isdigit())
+            stars = int(digits) if digits else None
+        rows.append({
+            "option": prop,
+            "price": _number((prop.get('rate_per_night') or {}).get('extracted_lowest')),
+            "stars": stars,
+            "rating": _number(prop.get('overall_rating')),
+            "reviews": _number(prop.get('reviews')),
+            "amenities": set(prop.get('amenities') or []),
+            "nearby": {place.get('name') for place in prop.get('nearby_places') or [] if isinstance(place, dict)},
+        })
+    return rows
+
+def get_index(engine, key, result):
+    """
+    Function to get the index of a search result, built on first use.
+    The key includes when the result was fetched, so a refreshed result gets a new index.
+
+    @PARAMS:
+        - engine -> 'google_flights' or 'google_hotels'
+        - key    -> the search cache key of the result
+        - result -> the search result
+    """
+    fetched_at = (result.get('freshness') or {}).get('fetched_at')
+    index_key = (engine, key, fetched_at)
+    with _INDEXES_LOCK:
+        rows = _INDEXES.get(index_key)
+        if rows is not None:
+            _INDEXES.move_to_end(index_key)
+            FILTER_STATS["index_hits"] += 1
+            return rows
+    rows = flight_index(result) if engine == 'google_flights' else hotel_index(result)
+    with _INDEXES_LOCK:
+        FILTER_STATS["index_builds"] += 1
+        _INDEXES[index_key] = rows
+        while len(_INDEXES) > FILTER_INDEX_MAX_ENTRIES:
+            _INDEXES.popitem(last=False)
+    return rows
+
+def flight_matches(row, filters):
+    """
+    Function to check one indexed flight against a FlightFilters object.
+    """
+    if filters.get('maxPrice') is not None and row["price"] is not None and row["price"] > filters['maxPrice']:
+        return False
+    if filters.get('maxDuration') is not None and row["duration"] is not None and row["duration"] > filters['maxDuration']:
+        return False
+    # -1 means any number of stops
+    if filters.get('stops') is not None and filters['stops'] != -1 and row["stops"] != filters['stops']:
+        return False
+    if filters.get('airlines') and not row["airlines"] & set(filters['airlines']):
+        return False
+    if filters.get('travelClass') and filters['travelClass'].lower() not in row["classes"]:
+        return False
+    bucket = DEPARTURE_TIMES.get(filters.get('departureTime') or '')
+    if bucket and row["departure"] is not None:
+        start, end = bucket
+        inside = start <= row["departure"] < end if start < end else (row["departure"] >= start or row["departure"] < end)
+        if not inside:
+            return False
+    return True
+
+def hotel_matches(row, filters):
+    """
+    Function to check one indexed property against a HotelFilters object.
+    """
+    price_range = filters.get('priceRange')
+    if price_range and row["price"]:
+        if row["price"] < price_range.get('min', 0) or row["price"] > price_range.get('max', float('inf')):
+            return False
+    if filters.get('starRating') and row["stars"] and row["stars"] not in filters['starRating']:
+        return False
+    if filters.get('minReviewScore') and row["rating"] and row["rating"] < filters['minReviewScore']:
+        return False
+    if filters.get('amenities') and not set(filters['amenities']) <= row["amenities"]:
+        return False
+    if filters.get('nearbyLocations') and not row["nearby"] & set(filters['nearbyLocations']):
+        return False
+    return True
+
+def sort_rows(rows, sort, allowed):
+    """
+    Function to sort indexed rows by a spec like 'price' or '-rating'; rows missing the
+    field go last either way. Unknown specs keep the result order.
+    """
+    if not sort:
+        return rows
+    field = sort.lstrip('-')
+    if field not in allowed:
+        return rows
+    field = "departure_time" if field == "departure" else field
+    present = [row for row in rows if row[field] is not None and row[field] != '']
+    missing = [row for row in rows if row[field] is None or row[field] == '']
+    return sorted(present, key=lambda row: row[field], reverse=sort.startswith('-')) + missing
+
+def _is_number(value):
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value)
+
+def _integer(value, name):
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"{name} must be an integer")
+    return value
+
+def parse_view(filters=None, sort=None, page=None, page_size=None):
+    """
+    Function to check the filters, sort, page and pageSize of a request.
+    Returns them as apply_view takes them, raises ValueError for the wrong types.
+    Page numbers out of range are clamped by apply_view rather than refused.
+
+    @PARAMS:
+        - filters   -> a FlightFilters or HotelFilters object, None for none
+        - sort      -> a sort spec string, None for the result order
+        - page      -> 1-based page number, an int or a string of digits
+        - page_size -> options per page, an int or a string of digits
+    """
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    for key, value in (filters or {}).items():
+        if value is None:
+            continue
+        if key in FILTER_NUMBER_FIELDS and not _is_number(value):
+            raise ValueError(f"Filter '{key}' must be a number")
+        if key in FILTER_LIST_FIELDS and not isinstance(value, list):
+            raise ValueError(f"Filter '{key}' must be a list")
+        if key in FILTER_STRING_FIELDS and not isinstance(value, str):
+            raise ValueError(f"Filter '{key}' must be a string")
+        if key == 'priceRange' and (not isinstance(value, dict) or not all(_is_number(value[bound]) for bound in ('min', 'max') if bound in value)):
+            raise ValueError("Filter 'priceRange' must be an object with numeric min and max")
+    if sort is not None and not isinstance(sort, str):
+        raise ValueError("sort must be a string")
+    return filters or {}, sort, _integer(page, "page"), _integer(page_size, "pageSize")
+
+def apply_view(engine, key, result, filters=None, sort=None, page=1, page_size=None):
+    """
+    Function to filter, sort and page a search result. Returns a copy of the result with
+    only the options of the requested page, plus a 'view' entry with the counts.
+    Flights keep their best/other split, paged over best first then other.
+
+    @PARAMS:
+        - engine    -> 'google_flights' or 'google_hotels'
+        - key       -> the search cache key of the result
+        - result    -> the search result
+        - filters   -> a FlightFilters or HotelFilters object
+        - sort      -> a FLIGHT_SORT_KEYS / HOTEL_SORT_KEYS spec, '-' prefix for descending
+        - page      -> 1-based page number
+        - page_size -> options per page, FILTER_PAGE_SIZE by default
+    Raises ValueError for invalid view fields, see parse_view.
+    """
+    if not isinstance(result, dict) or 'error' in result:
+        return result
+    filters, sort, page, page_size = parse_view(filters, sort, page, page_size)
+    page_size = max(1, min(page_size or FILTER_PAGE_SIZE, FILTER_MAX_PAGE_SIZE))
+    page = max(1, page or 1)
+
+    rows = get_index(engine, key, result)
+    if engine == 'google_flights':
+        matched = [row for row in rows if flight_matches(row, filters)]
+        # sorting stays within best and other, the frontend shows them apart
+        matched = (sort_rows([row for row in matched if row["source"] == 'best_flights'], sort, FLIGHT_SORT_KEYS)
+                   + sort_rows([row for row in matched if row["source"] == 'other_flights'], sort, FLIGHT_SORT_KEYS))
+    else:
+        matched = sort_rows([row for row in rows if hotel_matches(row, filters)], sort, HOTEL_SORT_KEYS)
+
+    selected = matched[(page - 1) * page_size:page * page_size]
+    view = dict(result)
+    if engine == 'google_flights':
+        view["best_flights"] = [row["option"] for row in selected if row["source"] == 'best_flights']
+        view["other_flights"] = [row["option"] for row in selected if row["source"] == 'other_flights']
+    else:
+        view["properties"] = [row["option"] for row in selected]
+    view["view"] = {
+        "total": len(rows),
+        "matched": len(matched),
+        "page": page,
+        "page_size": page_size,
+        "pages": (len(matched) + page_size - 1) // page_size,
+        "sort": sort or None
+    }
+    with _INDEXES_LOCK:
+        FILTER_STATS["views"] += 1
+    return view
+
+def get_filter_stats():
+    """
+    Function to get how often views reused a cached index.
+    """
+    with _INDEXES_LOCK:
+        stats = dict(FILTER_STATS)
+        stats["indexes"] = len(_INDEXES)
+    return stats
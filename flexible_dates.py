@@ -0,0 +1,212 @@
+"""
+Flexible-date flight search: a grid of searches around the requested dates, boiled down to
+a price calendar of the cheapest fare per outbound date and trip length. Cells run a few at
+a time under a container-wide rate limit; cells already in the search cache are free.
+"""
+
+import os
+import time
+import threading
+from datetime import date, datetime, timedelta
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from deadlines import DeadlineExceeded, remaining
+from telemetry import bind, span
+
+FLEX_MAX_DAYS = int(os.environ.get('FLEX_MAX_DAYS', '7'))
+FLEX_MAX_CELLS = int(os.environ.get('FLEX_MAX_CELLS', '45'))
+FLEX_CONCURRENCY = int(os.environ.get('FLEX_CONCURRENCY', '6'))
+# SerpAPI fetches per second the calendar may start, shared by every request in the container,
+# cached cells don't count
+FLEX_RATE_PER_SECOND = float(os.environ.get('FLEX_RATE_PER_SECOND', '5'))
+FLEX_RATE_BURST = int(os.environ.get('FLEX_RATE_BURST', '5'))
+
+class RateLimiter:
+    """
+    Token bucket shared by the threads of a container.
+
+    @PARAMS:
+        - rate  -> tokens added per second
+        - burst -> most tokens held at once
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Function to wait for a token. Raises DeadlineExceeded rather than wait past the deadline.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            left = remaining()
+            if left is not None and left < wait_seconds:
+                raise DeadlineExceeded("deadline would pass waiting for the search rate limit")
+            time.sleep(wait_seconds)
+
+FLEX_RATE_LIMITER = RateLimiter(FLEX_RATE_PER_SECOND, FLEX_RATE_BURST)
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f"flightParams.{name} must be a YYYY-MM-DD date")
+
+def flexible_date_cells(flight_params, flexible):
+    """
+    Function to list the (outbound, return) date pairs of a flexible-date search.
+    Outbound dates run from outbound_date - days to + days (never in the past). Return dates
+    follow returnLengths [min, max] nights when given, else the requested trip length,
+    else the search is one way.
+
+    @PARAMS:
+        - flight_params -> the direct search flightParams, with outbound_date
+        - flexible      -> the flexibleDates object, {"days": N, "returnLengths": [min, max]}
+    Raises ValueError for a malformed request or one over FLEX_MAX_CELLS date pairs.
+    """
+    if not isinstance(flight_params, dict) or not isinstance(flexible, dict):
+        raise ValueError("flightParams and flexibleDates must be objects")
+    days = flexible.get('days', 3)
+    if isinstance(days, bool) or not isinstance(days, int):
+        raise ValueError("flexibleDates.days must be an integer")
+    days = max(0, min(days, FLEX_MAX_DAYS))
+    base = _parse_date(flight_params.get('outbound_date'), 'outbound_date')
+    today = date.today()
+    outbound_dates = [base + timedelta(days=offset) for offset in range(-days, days + 1) if base + timedelta(days=offset) >= today]
+
+    lengths = flexible.get('returnLengths')
+    if lengths:
+        if isinstance(lengths, int) and not isinstance(lengths, bool):
+            lengths = [lengths]
+        if not isinstance(lengths, list) or not all(isinstance(length, int) and not isinstance(length, bool) for length in lengths):
+            raise ValueError("flexibleDates.returnLengths must be a number of nights or a [min, max] pair")
+        low, high = lengths[0], lengths[-1]
+        lengths = list(range(max(low, 0), max(high, low) + 1))
+    elif flight_params.get('return_date'):
+        lengths = [(_parse_date(flight_params['return_date'], 'return_date') - base).days]
+    else:
+        lengths = [None]
+
+    if len(outbound_dates) * len(lengths) > FLEX_MAX_CELLS:
+        raise ValueError(f"flexible search covers {len(outbound_dates) * len(lengths)} date pairs, the limit is {FLEX_MAX_CELLS}")
+    return [
+        (outbound, outbound + timedelta(days=length) if length is not None else None)
+        for length in lengths for outbound in outbound_dates
+    ], outbound_dates, lengths
+
+def cheapest_flight(flight_info):
+    """
+    Function to get the cheapest option of a google_flights result as (price, duration, stops).
+    """
+    options = (flight_info.get('best_flights') or []) + (flight_info.get('other_flights') or [])
+    priced = [option for option in options if isinstance(option.get('price'), (int, float))]
+    if not priced:
+        return None, None, None
+    option = min(priced, key=lambda option: option['price'])
+    return option['price'], option.get('total_duration'), max(len(option.get('flights') or []) - 1, 0)
+
+def search_calendar_cell(SERPAI_API_KEY, flight_params, outbound, return_date, search):
+    """
+    Function to search one date pair of the calendar and boil it down to its cheapest fare.
+
+    @PARAMS:
+        - SERPAI_API_KEY -> the google data api
+        - flight_params  -> the direct search flightParams
+        - outbound       -> the outbound date
+        - return_date    -> the return date, None for one way
+        - search         -> the search function, get_search_results
+    """
+    params = {"api_key": SERPAI_API_KEY, "engine": "google_flights", **flight_params, "outbound_date": outbound.isoformat()}
+    if return_date is not None:
+        params.update({"type": 1, "return_date": return_date.isoformat()})
+    else:
+        params.pop('return_date', None)
+        params["type"] = 2
+    cell = {"outbound_date": outbound.isoformat(), "return_date": return_date.isoformat() if return_date else None}
+    try:
+        flight_info = search(params, limiter=FLEX_RATE_LIMITER)
+    except Exception as e:
+        return {**cell, "error": str(e)}
+    if not isinstance(flight_info, dict) or 'error' in flight_info:
+        return {**cell, "error": str(flight_info.get('error') if isinstance(flight_info, dict) else flight_info)}
+    price, duration, stops = cheapest_flight(flight_info)
+    return {
+        **cell, "price": price, "duration": duration, "stops": stops,
+        "cached": (flight_info.get('freshness') or {}).get('source') == 'cache'
+    }
+
+def price_calendar(SERPAI_API_KEY, flight_params, flexible, search, executor, emit=None):
+    """
+    Function to run a flexible-date flight search, FLEX_CONCURRENCY cells at a time under
+    FLEX_RATE_LIMITER, and return a compact price matrix: rows are return lengths (one row
+    for one way), columns are outbound dates, each cell holds the cheapest price and its
+    duration in minutes.
+
+    @PARAMS:
+        - SERPAI_API_KEY -> the google data api
+        - flight_params  -> the direct search flightParams, with outbound_date
+        - flexible       -> the flexibleDates object
+        - search         -> the search function, get_search_results
+        - executor       -> the pool the cells run on
+        - emit           -> optional callback, gets a 'cell' event as each cell lands
+    """
+    cells, outbound_dates, lengths = flexible_date_cells(flight_params, flexible)
+    print(f"Processing flexible-date flight search over {len(cells)} date pairs")
+    columns = {outbound.isoformat(): column for column, outbound in enumerate(outbound_dates)}
+    rows = {length: row for row, length in enumerate(lengths)}
+    prices = [[None] * len(outbound_dates) for _ in lengths]
+    durations = [[None] * len(outbound_dates) for _ in lengths]
+    results = []
+
+    queued = list(cells)
+    running = set()
+    with span("calendar", cells=len(cells)):
+        while queued or running:
+            while queued and len(running) < FLEX_CONCURRENCY:
+                outbound, return_date = queued.pop(0)
+                running.add(executor.submit(bind(search_calendar_cell), SERPAI_API_KEY, flight_params, outbound, return_date, search))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                cell = future.result()
+                results.append(cell)
+                length = (datetime.strptime(cell['return_date'], '%Y-%m-%d') - datetime.strptime(cell['outbound_date'], '%Y-%m-%d')).days if cell['return_date'] else None
+                row, column = rows[length], columns[cell['outbound_date']]
+                prices[row][column] = cell.get('price')
+                durations[row][column] = cell.get('duration')
+                if emit is not None:
+                    emit('cell', {**cell, "row": row, "column": column})
+
+    priced = [cell for cell in results if cell.get('price') is not None]
+    return {
+        "departure_id": flight_params.get('departure_id'),
+        "arrival_id": flight_params.get('arrival_id'),
+        "outbound_dates": [outbound.isoformat() for outbound in outbound_dates],
+        "return_lengths": lengths if lengths != [None] else None,
+        "prices": prices,
+        "durations": durations,
+        "cheapest": min(priced, key=lambda cell: cell['price']) if priced else None,
+        "errors": sum(1 for cell in results if 'error' in cell),
+        "cached": sum(1 for cell in results if cell.get('cached'))
+    }
+
+def calendar_summary(calendar, currency):
+    """
+    Function to describe the cheapest cell of a price calendar in one sentence.
+    """
+    cheapest = calendar.get('cheapest')
+    route = f"{calendar.get('departure_id', '')} to {calendar.get('arrival_id', '')}"
+    if not cheapest:
+        return f"I couldn't find prices for flights from {route} around those dates."
+    returning = f", returning {cheapest['return_date']}" if cheapest.get('return_date') else ""
+    return f"The cheapest flight from {route} is {cheapest['price']} {currency}, leaving {cheapest['outbound_date']}{returning}."
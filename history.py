@@ -0,0 +1,179 @@
+"""
+Incremental conversation history. The standalone query GPT rewrites for every turn is
+cached under that turn and the user turn before it, so the next turn sends that rewrite as
+a summary plus only the messages after it, instead of the whole chat.
+The frontend (formatChatHistory in src/app/api/search/route.ts) sends the last
+HISTORY_WINDOW messages numbered from the oldest in the window, so the numbers shift on
+every turn; keys are built from the user turns' text alone, without roles, numbers,
+assistant replies or the header and notes around them.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+HISTORY_CACHE_ENABLED = os.environ.get('HISTORY_CACHE_ENABLED', 'true').lower() == 'true'
+HISTORY_CACHE_MAX_ENTRIES = int(os.environ.get('HISTORY_CACHE_MAX_ENTRIES', '1024'))
+# the most history sent to GPT per call, estimated at HISTORY_CHARS_PER_TOKEN
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '600'))
+HISTORY_CHARS_PER_TOKEN = 4
+# messages formatChatHistory keeps, a shorter history is the whole conversation
+HISTORY_WINDOW = int(os.environ.get('HISTORY_WINDOW', '5'))
+# "User (Message #3): ..." and "Assistant (Message #2): ...", an assistant reply runs over several lines
+HISTORY_MESSAGE_RE = re.compile(r'^(user|assistant)\s*\(message\s*#(\d+)\)\s*:\s?', re.I)
+HISTORY_HEADER_RE = re.compile(r'^previous conversation(?: with numbered references)?:\s*$', re.I)
+# the instructions formatChatHistory appends after the messages
+HISTORY_NOTES_RE = re.compile(r'^note:\s*messages are numbered', re.I)
+# hand-written histories, one turn per line with an optional role label
+HISTORY_ROLE_RE = re.compile(r'^(user|you|me|human|question|assistant|ai|bot)\s*:\s*', re.I)
+HISTORY_STATS = {"requests": 0, "hits": 0, "turns_total": 0, "turns_sent": 0, "turns_trimmed": 0, "chars_total": 0, "chars_sent": 0}
+_HISTORY_LOCK = threading.Lock()
+
+_HISTORY_CACHE = OrderedDict()
+
+def _cached_rewrite(key):
+    with _HISTORY_LOCK:
+        summary = _HISTORY_CACHE.get(key)
+        if summary is not None:
+            _HISTORY_CACHE.move_to_end(key)
+        return summary
+
+def _cache_rewrite(key, summary):
+    with _HISTORY_LOCK:
+        _HISTORY_CACHE[key] = summary
+        _HISTORY_CACHE.move_to_end(key)
+        while len(_HISTORY_CACHE) > HISTORY_CACHE_MAX_ENTRIES:
+            _HISTORY_CACHE.popitem(last=False)
+
+def _numbered_turns(lines):
+    turns = []
+    for line in lines:
+        if HISTORY_NOTES_RE.match(line.strip()):
+            break
+        match = HISTORY_MESSAGE_RE.match(line.strip())
+        if match:
+            turns.append([int(match.group(2)), match.group(1).lower(), line.strip()[match.end():]])
+        elif turns:
+            turns[-1][2] += '\n' + line
+    return [(role, text.strip()) for _, role, text in sorted(turns, key=lambda turn: turn[0])]
+
+def history_turns(conversation_history):
+    """
+    Function to split the history from extract_conversation_history into turns in the order
+    they were said, as (role, text) with role 'user' or 'assistant'.
+    formatChatHistory lists the newest message first, turns are put back in message number
+    order. Without message labels every non-empty line is a turn, a user turn unless it is
+    labelled as the assistant's.
+    """
+    lines = (conversation_history or "").splitlines()
+    if any(HISTORY_MESSAGE_RE.match(line.strip()) for line in lines):
+        return _numbered_turns(lines)
+
+    turns = []
+    for line in lines:
+        line = line.strip()
+        if not line or HISTORY_HEADER_RE.match(line):
+            continue
+        match = HISTORY_ROLE_RE.match(line)
+        role = 'assistant' if match and match.group(1).lower() in ('assistant', 'ai', 'bot') else 'user'
+        turns.append((role, line[match.end():] if match else line))
+    return turns
+
+def history_key(previous_turn, turn):
+    """
+    Function to get the cache key of a user turn, from its text and the user turn before it.
+    Turns are compared without case or extra whitespace.
+
+    @PARAMS:
+        - previous_turn -> the text of the user turn before, '' at the start of the chat
+        - turn          -> the user turn's text
+    """
+    normalized = ['' if text is None else ' '.join(text.lower().split()) for text in (previous_turn, turn)]
+    return hashlib.sha256('\n'.join(normalized).encode('utf-8')).hexdigest()
+
+def _render(role, text):
+    return f"{role.capitalize()}: {text}"
+
+def compact_history(conversation_history):
+    """
+    Function to get the history to send to GPT and the user turn it ends on.
+    Everything up to the newest user turn with a cached rewrite is replaced by that rewrite,
+    only the messages after it are sent, as "User: ..." and "Assistant: ...", and the result
+    is held to HISTORY_TOKEN_BUDGET by dropping the oldest of those messages.
+
+    @PARAMS:
+        - conversation_history -> the history of the chat
+    """
+    turns = history_turns(conversation_history)
+    users = [index for index, (role, _) in enumerate(turns) if role == 'user']
+    last_turn = turns[users[-1]][1] if users else ''
+
+    summary, covered = None, 0
+    if HISTORY_CACHE_ENABLED:
+        for position in range(len(users) - 1, -1, -1):
+            if position > 0:
+                previous = turns[users[position - 1]][1]
+            elif users[0] == 0 and len(turns) < HISTORY_WINDOW:
+                previous = ''
+            else:
+                # the user turn before it fell out of the window, the key can't be rebuilt
+                break
+            summary = _cached_rewrite(history_key(previous, turns[users[position]][1]))
+            if summary is not None:
+                covered = users[position] + 1
+                break
+
+    # the summary may use up to half the budget, the newest messages get the rest
+    budget = HISTORY_TOKEN_BUDGET * HISTORY_CHARS_PER_TOKEN
+    parts = []
+    if summary:
+        summary_text = f"Summary of the earlier conversation: {summary[:budget // 2]}"
+        parts.append(summary_text)
+        budget -= len(summary_text)
+    new_turns = []
+    for role, text in reversed(turns[covered:]):
+        turn = _render(role, text)
+        if len(turn) > budget:
+            break
+        new_turns.insert(0, turn)
+        budget -= len(turn) + 1
+    history = '\n'.join(parts + new_turns)
+
+    with _HISTORY_LOCK:
+        HISTORY_STATS["requests"] += 1
+        HISTORY_STATS["hits"] += 1 if summary is not None else 0
+        HISTORY_STATS["turns_total"] += len(turns)
+        HISTORY_STATS["turns_sent"] += len(new_turns)
+        HISTORY_STATS["turns_trimmed"] += len(turns) - covered - len(new_turns)
+        HISTORY_STATS["chars_total"] += len(conversation_history or "")
+        HISTORY_STATS["chars_sent"] += len(history)
+    if turns:
+        print(f"Conversation history: {len(turns)} turns, {covered} from cache, sending {len(new_turns)}")
+    return history, last_turn
+
+def remember_rewrite(last_turn, user_input, rewritten_query):
+    """
+    Function to cache a turn's rewritten query as the summary of the conversation up to and
+    including that turn, ready for the next turns whose history has it.
+
+    @PARAMS:
+        - last_turn       -> the user turn the history ended on, from compact_history
+        - user_input      -> the turn the query was rewritten for
+        - rewritten_query -> the standalone query
+    """
+    if not HISTORY_CACHE_ENABLED or not rewritten_query or not rewritten_query.strip():
+        return
+    _cache_rewrite(history_key(last_turn, user_input), rewritten_query.strip())
+
+def get_history_stats():
+    """
+    Function to get how much conversation history the prefix cache kept out of the prompts.
+    """
+    with _HISTORY_LOCK:
+        stats = dict(HISTORY_STATS)
+        stats["entries"] = len(_HISTORY_CACHE)
+    stats["hit_rate"] = stats["hits"] / stats["requests"] if stats["requests"] else 0.0
+    stats["chars_saved"] = stats["chars_total"] - stats["chars_sent"]
+    return stats
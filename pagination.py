@@ -0,0 +1,92 @@
+"""
+Cursor pagination over SerpAPI results. Pages past the first are fetched through
+next_page_token; the cursor handed to the frontend is an opaque token holding the search
+params and that token, and the page after the one served is prefetched into the cache.
+"""
+
+import os
+import json
+import base64
+
+from deadlines import clear_deadline
+from telemetry import bind
+
+# fetch the page after the one served in the background so the next cursor hits the cache
+PAGINATION_PREFETCH = os.environ.get('PAGINATION_PREFETCH', 'true').lower() == 'true'
+PAGINATION_ENGINES = ('google_flights', 'google_hotels')
+
+def encode_cursor(params, token):
+    """
+    Function to build the opaque cursor for the page after a search result.
+    It holds the search params (never the api key) and SerpAPI's next_page_token.
+
+    @PARAMS:
+        - params -> the params of the search the token came from
+        - token  -> serpapi_pagination.next_page_token
+    """
+    base = {key: value for key, value in params.items() if key not in ('api_key', 'next_page_token')}
+    cursor = json.dumps({"params": base, "token": token}, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Function to get the search params of the page a cursor points at, without the api key.
+    Raises ValueError for a cursor this code didn't issue.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        decoded = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        params, token = decoded['params'], decoded['token']
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(params, dict) or params.get('engine') not in PAGINATION_ENGINES or not token:
+        raise ValueError("Invalid cursor")
+    return {**params, "next_page_token": token}
+
+def with_cursor(result, params):
+    """
+    Function to add the cursor of the next page to a search result that has one.
+    """
+    if not isinstance(result, dict) or 'error' in result:
+        return result
+    token = (result.get('serpapi_pagination') or {}).get('next_page_token')
+    if not token:
+        return result
+    return {**result, "next_cursor": encode_cursor(params, token)}
+
+def prefetch_page(search, params):
+    """
+    Function to fetch a page into the search cache ahead of the request for it.
+    It outlives the request that started it, so it isn't held to that request's deadline.
+    """
+    clear_deadline()
+    try:
+        search(params)
+    except Exception as e:
+        print(f"Error prefetching search page: {str(e)}")
+
+def iter_search_pages(params, search, executor, prefetch=None):
+    """
+    Generator over the pages of a search, fetched on demand through next_page_token.
+    While a page is being used, the next one is already loading on the executor.
+    Every page goes through the cached search, so pages are cached per search and token.
+
+    @PARAMS:
+        - params   -> the search params, with next_page_token to start past the first page
+        - search   -> the search function, get_search_results
+        - executor -> the pool the next page loads on
+        - prefetch -> load the next page in the background, defaults to PAGINATION_PREFETCH
+    """
+    if prefetch is None:
+        prefetch = PAGINATION_PREFETCH
+    page_params = dict(params)
+    while True:
+        result = search(page_params)
+        token = (result.get('serpapi_pagination') or {}).get('next_page_token') if isinstance(result, dict) else None
+        if not token:
+            yield result
+            return
+        page_params = {**params, "next_page_token": token}
+        if prefetch:
+            executor.submit(bind(prefetch_page), search, page_params)
+        yield result
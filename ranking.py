@@ -0,0 +1,221 @@
+"""
+Budget-aware ranking of flight x hotel combinations. Every option SerpAPI returned is turned
+into columns (price, duration, stops, rating, nightly and total rate), all pairs are scored
+at once against the budget and the user's weights, and the top-K come back with what is
+left of the budget for activities.
+NumPy does the pair scoring when it is installed, a plain Python loop otherwise.
+The options come from the parsed SerpAPI results, which keep at most SEARCH_MAX_ITEMS
+entries per list (api_code.py): up to 2 x 20 flights and 20 properties, 800 combinations
+with the defaults. Raising SEARCH_MAX_ITEMS ranks more of them, for every search.
+"""
+
+import os
+import math
+
+# how many combinations analyze_intent returns
+RANK_TOP_K = int(os.environ.get('RANK_TOP_K', '5'))
+# relative weight of each criterion, a request can override any of them
+DEFAULT_RANK_WEIGHTS = {"price": 1.0, "duration": 0.3, "stops": 0.3, "rating": 0.5}
+
+_NUMPY = None
+
+def _numpy():
+    """
+    Function to import numpy on first use, False if it isn't installed.
+    """
+    global _NUMPY
+    if _NUMPY is None:
+        try:
+            import numpy
+            _NUMPY = numpy
+        except ImportError:
+            _NUMPY = False
+    return _NUMPY
+
+def parse_weights(weights):
+    """
+    Function to check ranking weight overrides from a request and return them as floats.
+    Raises ValueError for anything but an object of known criteria with non-negative numbers.
+
+    @PARAMS:
+        - weights -> the request's weights, None for none
+    """
+    if weights is None:
+        return {}
+    if not isinstance(weights, dict):
+        raise ValueError("weights must be an object")
+    parsed = {}
+    for key, value in weights.items():
+        if key not in DEFAULT_RANK_WEIGHTS:
+            raise ValueError(f"Unknown weight '{key}', expected one of {', '.join(DEFAULT_RANK_WEIGHTS)}")
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise ValueError(f"Weight '{key}' must be a non-negative number")
+        parsed[key] = float(value)
+    return parsed
+
+def parse_price(value):
+    """
+    Function to read a SerpAPI price, numbers as they are and strings like "$1,234".
+    Returns None when there is no price.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    digits = ''.join(c for c in str(value) if c.isdigit() or c == '.')
+    try:
+        return float(digits) if digits else None
+    except ValueError:
+        return None
+
+def flight_columns(flight_info):
+    """
+    Function to get the columns of every priced option in best_flights and other_flights.
+
+    @PARAMS:
+        - flight_info -> the google_flights result
+    """
+    columns = {"price": [], "duration": [], "stops": [], "source": [], "index": []}
+    if not isinstance(flight_info, dict):
+        return columns
+    for source in ('best_flights', 'other_flights'):
+        for index, option in enumerate(flight_info.get(source) or []):
+            price = parse_price(option.get('price'))
+            if price is None:
+                continue
+            columns["price"].append(price)
+            columns["duration"].append(float(option.get('total_duration') or 0))
+            columns["stops"].append(float(max(len(option.get('flights') or []) - 1, 0)))
+            columns["source"].append(source)
+            columns["index"].append(index)
+    return columns
+
+def hotel_columns(hotel_info, nights=None):
+    """
+    Function to get the columns of every priced property. The total is total_rate when
+    SerpAPI gives it, otherwise the nightly rate times the nights.
+
+    @PARAMS:
+        - hotel_info -> the google_hotels result
+        - nights     -> nights of the stay, for properties with only a nightly rate
+    """
+    columns = {"price": [], "nightly": [], "rating": [], "index": []}
+    if not isinstance(hotel_info, dict):
+        return columns
+    for index, prop in enumerate(hotel_info.get('properties') or []):
+        nightly = parse_price((prop.get('rate_per_night') or {}).get('extracted_lowest'))
+        if nightly is None:
+            nightly = parse_price((prop.get('rate_per_night') or {}).get('lowest'))
+        total = parse_price((prop.get('total_rate') or {}).get('extracted_lowest'))
+        if total is None:
+            total = parse_price((prop.get('total_rate') or {}).get('lowest'))
+        if total is None and nightly is not None:
+            total = nightly * (nights or 1)
+        if total is None:
+            continue
+        columns["price"].append(total)
+        columns["nightly"].append(nightly if nightly is not None else math.nan)
+        columns["rating"].append(float(prop.get('overall_rating') or 0))
+        columns["index"].append(index)
+    return columns
+
+def _normalized(values):
+    """
+    Function to scale a list to 0..1, all zeros when it has no spread.
+    """
+    low, high = min(values), max(values)
+    return [(value - low) / (high - low) if high > low else 0.0 for value in values]
+
+def _side_scores(flights, hotels, weights):
+    """
+    Function to get the per-option score of each side, lower is better. Price is scored on
+    the pair total instead, so it isn't part of these.
+    """
+    flight_scores = [
+        weights["duration"] * duration + weights["stops"] * stops
+        for duration, stops in zip(_normalized(flights["duration"]), _normalized(flights["stops"]))
+    ] if flights["price"] else [0.0]
+    hotel_scores = [
+        -weights["rating"] * rating for rating in _normalized(hotels["rating"])
+    ] if hotels["price"] else [0.0]
+    return flight_scores, hotel_scores
+
+def _rank_numpy(np, flight_prices, hotel_prices, flight_scores, hotel_scores, budget, weights, top_k):
+    totals = np.add.outer(np.asarray(flight_prices), np.asarray(hotel_prices))
+    spread = totals.max() - totals.min()
+    price_score = (totals - totals.min()) / spread if spread > 0 else np.zeros_like(totals)
+    scores = weights["price"] * price_score + np.add.outer(np.asarray(flight_scores), np.asarray(hotel_scores))
+    if budget:
+        # anything over budget ranks after everything within it
+        scores = scores + (totals > budget) * (1 + np.abs(scores).max() * 2)
+    flat = scores.ravel()
+    k = min(top_k, flat.size)
+    best = np.argpartition(flat, k - 1)[:k]
+    best = best[np.argsort(flat[best], kind='stable')]
+    columns = totals.shape[1]
+    return [(int(position // columns), int(position % columns), float(totals.flat[position]), float(flat[position])) for position in best]
+
+def _rank_python(flight_prices, hotel_prices, flight_scores, hotel_scores, budget, weights, top_k):
+    totals = [(f, h, fp + hp) for f, fp in enumerate(flight_prices) for h, hp in enumerate(hotel_prices)]
+    low = min(total for _, _, total in totals)
+    high = max(total for _, _, total in totals)
+    scored = []
+    for f, h, total in totals:
+        score = weights["price"] * ((total - low) / (high - low) if high > low else 0.0) + flight_scores[f] + hotel_scores[h]
+        scored.append((f, h, total, score))
+    if budget:
+        penalty = 1 + max(abs(score) for _, _, _, score in scored) * 2
+        scored = [(f, h, total, score + (penalty if total > budget else 0)) for f, h, total, score in scored]
+    scored.sort(key=lambda pair: pair[3])
+    return scored[:top_k]
+
+def rank_trips(flight_info, hotel_info, budget=0, weights=None, top_k=None, nights=None):
+    """
+    Function to rank every flight x hotel combination against the budget and weights.
+    With only one side searched the other counts as free. Returns the top-K combinations,
+    best first, each with its costs, the budget left for activities and where its options
+    sit in the search results.
+
+    @PARAMS:
+        - flight_info -> the google_flights result, or None
+        - hotel_info  -> the google_hotels result, or None
+        - budget      -> the trip budget, 0 for none
+        - weights     -> overrides of DEFAULT_RANK_WEIGHTS, see parse_weights
+        - top_k       -> how many combinations to return, RANK_TOP_K by default
+        - nights      -> nights of the hotel stay
+    """
+    weights = {**DEFAULT_RANK_WEIGHTS, **parse_weights(weights)}
+    top_k = top_k or RANK_TOP_K
+    flights = flight_columns(flight_info)
+    hotels = hotel_columns(hotel_info, nights)
+    if not flights["price"] and not hotels["price"]:
+        return []
+
+    flight_prices = flights["price"] or [0.0]
+    hotel_prices = hotels["price"] or [0.0]
+    flight_scores, hotel_scores = _side_scores(flights, hotels, weights)
+    np = _numpy()
+    if np:
+        ranked = _rank_numpy(np, flight_prices, hotel_prices, flight_scores, hotel_scores, budget, weights, top_k)
+    else:
+        ranked = _rank_python(flight_prices, hotel_prices, flight_scores, hotel_scores, budget, weights, top_k)
+
+    trips = []
+    for f, h, total, score in ranked:
+        trip = {"total_cost": round(total, 2), "score": round(score, 4)}
+        if flights["price"]:
+            trip["flight"] = {
+                "source": flights["source"][f], "index": flights["index"][f], "price": flights["price"][f],
+                "duration": flights["duration"][f], "stops": int(flights["stops"][f])
+            }
+        if hotels["price"]:
+            nightly = hotels["nightly"][h]
+            trip["hotel"] = {
+                "index": hotels["index"][h], "price": hotels["price"][h],
+                "nightly": None if math.isnan(nightly) else nightly, "rating": hotels["rating"][h]
+            }
+        if budget:
+            trip["within_budget"] = total <= budget
+            trip["remaining_budget"] = round(budget - total, 2)
+        trips.append(trip)
+    return trips
@@ -0,0 +1,251 @@
+"""
+Single-flight coalescing for upstream calls. Concurrent calls with the same key share one
+execution: the first caller (the leader) runs the call and every caller that arrives while
+it is in flight waits for and gets the same result, or the same exception.
+With SINGLEFLIGHT_LOCK_DIR set, processes on the same host coalesce too: the leader holds
+an flock on a per-key file, and when other processes have registered as waiting it leaves
+its result next to it for them. The leader deletes its lock file when it is done and the
+last waiter deletes the result, so nothing stays on disk once the call is over.
+"""
+
+import os
+import glob
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from deadlines import DeadlineExceeded, remaining
+
+SINGLEFLIGHT_ENABLED = os.environ.get('SINGLEFLIGHT_ENABLED', 'true').lower() == 'true'
+# optional directory for the cross-process lock and result files, e.g. /tmp/traveler-singleflight
+SINGLEFLIGHT_LOCK_DIR = os.environ.get('SINGLEFLIGHT_LOCK_DIR', '')
+# how long a leader's result file answers processes that waited on its lock
+SINGLEFLIGHT_RESULT_TTL = float(os.environ.get('SINGLEFLIGHT_RESULT_TTL', '5'))
+# the longest a process waits on another's lock when there is no deadline
+SINGLEFLIGHT_LOCK_TIMEOUT = float(os.environ.get('SINGLEFLIGHT_LOCK_TIMEOUT', '30'))
+
+def coalesce_key(*parts):
+    """
+    Function to hash the parts that make two calls identical into a key.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _shared(value):
+    # callers may set top-level fields on dict results, give each its own copy
+    return dict(value) if isinstance(value, dict) else value
+
+class SingleFlight:
+    """
+    Groups concurrent calls by key within the process, and across processes through
+    lock files when a lock directory is given.
+
+    @PARAMS:
+        - lock_dir -> directory for the cross-process lock and result files, '' for none
+    """
+
+    def __init__(self, lock_dir=''):
+        self.lock_dir = lock_dir
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0, "cross_process": 0}
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._fcntl = None
+        self._swept_at = 0.0
+        if lock_dir:
+            try:
+                import fcntl
+                # results are prompts and answers, keep them to this user
+                os.makedirs(lock_dir, mode=0o700, exist_ok=True)
+                self._fcntl = fcntl
+            except (ImportError, OSError) as e:
+                print(f"Error setting up cross-process single-flight, keeping it in-process: {str(e)}")
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Function to run fn(*args, **kwargs) once for all concurrent callers with this key.
+        Waiters give up with DeadlineExceeded when the request deadline passes first.
+
+        @PARAMS:
+            - key -> the normalized call key, see coalesce_key
+            - fn  -> the upstream call
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            try:
+                return _shared(future.result(timeout=remaining()))
+            except FutureTimeoutError:
+                raise DeadlineExceeded("deadline passed waiting on a coalesced call")
+
+        try:
+            result = self._execute(key, fn, *args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _execute(self, key, fn, *args, **kwargs):
+        """
+        Function to run the call as this process's leader, coalescing with other processes
+        through the lock file when cross-process coalescing is on.
+        """
+        if self._fcntl is None:
+            self._count("executions")
+            return fn(*args, **kwargs)
+
+        fcntl = self._fcntl
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        self._sweep()
+        while True:
+            lock_file = open(os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600), 'r+')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # another process is making this call, wait for it and use its result
+                found = self._wait_for_leader(fcntl, key, lock_file)
+                if found is not None:
+                    self._count("cross_process")
+                    return found[0]
+                # the leader failed or finished before we registered, make the call ourselves
+                self._count("executions")
+                return fn(*args, **kwargs)
+            # a leader deletes its lock file when it is done, a file we opened before that
+            # isn't the lock anymore and holding it excludes nobody
+            if self._same_file(lock_file, lock_path):
+                break
+            lock_file.close()
+
+        try:
+            self._count("executions")
+            result = fn(*args, **kwargs)
+            # the result only goes to disk when another process is waiting for it
+            if self._waiters(key):
+                self._write_result(os.path.join(self.lock_dir, f"{key}.json"), result)
+            return result
+        finally:
+            self._remove(lock_path)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _same_file(self, lock_file, lock_path):
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        except OSError:
+            return False
+
+    def _waiters(self, key):
+        return glob.glob(os.path.join(glob.escape(self.lock_dir), f"{key}.wait-*"))
+
+    def _wait_for_leader(self, fcntl, key, lock_file):
+        """
+        Function to register as a waiter, block until the leader releases its lock and read
+        the result it left. The last waiter out deletes the result. Returns (result,) or None.
+        """
+        marker = os.path.join(self.lock_dir, f"{key}.wait-{os.getpid()}-{threading.get_ident()}")
+        result_path = os.path.join(self.lock_dir, f"{key}.json")
+        try:
+            os.close(os.open(marker, os.O_WRONLY | os.O_CREAT, 0o600))
+            self._wait_for_lock(fcntl, lock_file)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return self._read_result(result_path)
+        finally:
+            lock_file.close()
+            self._remove(marker)
+            if not self._waiters(key):
+                self._remove(result_path)
+
+    def _wait_for_lock(self, fcntl, lock_file):
+        left = remaining()
+        give_up = time.monotonic() + (left if left is not None else SINGLEFLIGHT_LOCK_TIMEOUT)
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= give_up:
+                    raise DeadlineExceeded("deadline passed waiting on another process's call")
+                time.sleep(0.02)
+
+    def _read_result(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) > SINGLEFLIGHT_RESULT_TTL:
+                return None
+            with open(path, 'r', encoding='utf-8') as file:
+                return (json.load(file),)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, path, result):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as file:
+                json.dump(result, file)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error writing single-flight result: {str(e)}")
+            self._remove(tmp_path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _sweep(self):
+        """
+        Function to delete what crashed processes left behind: results and waiter markers
+        past the result TTL, lock files older than anyone would wait on them.
+        Runs at most once per SINGLEFLIGHT_RESULT_TTL.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._swept_at < SINGLEFLIGHT_RESULT_TTL:
+                return
+            self._swept_at = now
+        try:
+            entries = list(os.scandir(self.lock_dir))
+        except OSError:
+            return
+        for entry in entries:
+            max_age = SINGLEFLIGHT_LOCK_TIMEOUT if entry.name.endswith('.lock') else SINGLEFLIGHT_RESULT_TTL
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    self._remove(entry.path)
+            except OSError:
+                pass
+
+    def snapshot(self):
+        """
+        Function to get the counters and the coalescing ratio, the share of calls that
+        didn't go upstream themselves.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        stats["coalescing_ratio"] = (stats["coalesced"] + stats["cross_process"]) / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+SINGLE_FLIGHT = SingleFlight(SINGLEFLIGHT_LOCK_DIR)
+
+def get_singleflight_stats():
+    return SINGLE_FLIGHT.snapshot()
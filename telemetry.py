@@ -0,0 +1,203 @@
+"""
+Per-request tracing for the lambda: timing spans per pipeline stage, emitted as CloudWatch
+embedded metric format (EMF) lines, plus sampled, size-capped debug logging.
+Everything is tagged with the request id so one invocation's stages can be pulled together.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'Traveler')
+# share of requests whose payloads get logged, and the max characters logged per payload
+DEBUG_LOG_SAMPLE_RATE = float(os.environ.get('DEBUG_LOG_SAMPLE_RATE', '0.01'))
+DEBUG_LOG_MAX_CHARS = int(os.environ.get('DEBUG_LOG_MAX_CHARS', '2048'))
+
+# numeric span fields that are published as metrics, everything else is a searchable property
+METRIC_UNITS = {
+    "Duration": "Milliseconds",
+    "BytesIn": "Bytes",
+    "BytesOut": "Bytes",
+    "CacheHit": "Count",
+    "Error": "Count",
+    "BreakerState": "None",
+}
+
+_REQUEST = contextvars.ContextVar('traveler_request', default=None)
+
+class RequestTrace:
+    """
+    The spans recorded for one request, shared by every thread working on it.
+    """
+
+    def __init__(self, request_id, sampled):
+        self.request_id = request_id
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, duration_ms):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + duration_ms
+
+    def summary(self):
+        with self._lock:
+            stages = {stage: round(ms, 1) for stage, ms in self.stages.items()}
+        return {
+            "request_id": self.request_id,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages": stages
+        }
+
+class Span:
+    """
+    One timed stage. Metrics are numbers published under METRIC_UNITS, properties
+    are extra fields on the log line (status codes, engines, providers).
+    """
+
+    def __init__(self, stage, properties):
+        self.stage = stage
+        self.metrics = {}
+        self.properties = dict(properties)
+
+    def set(self, name, value):
+        if name in METRIC_UNITS:
+            self.metrics[name] = value
+        else:
+            self.properties[name] = value
+
+    def add(self, name, value=1):
+        self.metrics[name] = self.metrics.get(name, 0) + value
+
+def start_request(request_id=None):
+    """
+    Function to begin a trace for a new request, returns the trace.
+    The sampling decision is made once here so a sampled request logs every stage.
+
+    @PARAMS:
+        - request_id -> the lambda/API Gateway request id, generated if missing
+    """
+    trace = RequestTrace(request_id or uuid.uuid4().hex, random.random() < DEBUG_LOG_SAMPLE_RATE)
+    _REQUEST.set(trace)
+    return trace
+
+def current_request_id():
+    trace = _REQUEST.get()
+    return trace.request_id if trace else None
+
+def end_request():
+    """
+    Function to log the per-stage summary of the current request and clear it.
+    """
+    trace = _REQUEST.get()
+    if trace is None:
+        return None
+    summary = trace.summary()
+    if METRICS_ENABLED:
+        print(json.dumps({"trace": summary}))
+    _REQUEST.set(None)
+    return summary
+
+def emit_metrics(stage, metrics, properties=None):
+    """
+    Function to print one EMF line, CloudWatch turns it into metrics with a Stage dimension.
+
+    @PARAMS:
+        - stage      -> the pipeline stage name
+        - metrics    -> {metric name: value}, units from METRIC_UNITS
+        - properties -> extra fields kept on the log line
+    """
+    if not METRICS_ENABLED:
+        return
+    line = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["Stage"]],
+                "Metrics": [{"Name": name, "Unit": METRIC_UNITS.get(name, "None")} for name in metrics]
+            }]
+        },
+        "Stage": stage,
+        "request_id": current_request_id(),
+        **(properties or {}),
+        **metrics
+    }
+    print(json.dumps(line, default=str))
+
+@contextmanager
+def span(stage, **properties):
+    """
+    Context manager that times a stage and emits it as metrics when it ends.
+    Exceptions are counted as an Error on the span and re-raised.
+
+    @PARAMS:
+        - stage      -> the pipeline stage name, the metric dimension
+        - properties -> extra fields for the log line
+    """
+    current = Span(stage, properties)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception:
+        current.set("Error", 1)
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        current.set("Duration", round(duration_ms, 2))
+        trace = _REQUEST.get()
+        if trace is not None:
+            trace.record(stage, duration_ms)
+        emit_metrics(stage, current.metrics, current.properties)
+
+def traced(stage):
+    """
+    Decorator that runs every call of a function inside a span.
+
+    @PARAMS:
+        - stage -> the pipeline stage name
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def debug_log(label, payload):
+    """
+    Function to log a payload for sampled requests only, truncated to DEBUG_LOG_MAX_CHARS.
+
+    @PARAMS:
+        - label   -> what the payload is
+        - payload -> any value, serialized with json where possible
+    """
+    trace = _REQUEST.get()
+    if trace is None or not trace.sampled:
+        return
+    try:
+        text = payload if isinstance(payload, str) else json.dumps(payload, default=str)
+    except (TypeError, ValueError):
+        text = repr(payload)
+    if len(text) > DEBUG_LOG_MAX_CHARS:
+        text = f"{text[:DEBUG_LOG_MAX_CHARS]}... ({len(text)} chars)"
+    print(f"[{trace.request_id}] {label}: {text}")
+
+def bind(fn):
+    """
+    Function to carry the current request (and its trace) into work run on another thread.
+
+    @PARAMS:
+        - fn -> the callable to run later
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the backend modules live at the repo root next to api_code.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+import json
+import asyncio
+
+import pytest
+
+import api_code
+import api_server
+from api_server import SERVER_MAX_BODY_BYTES, ApiServer
+
+def call(app, method="POST", path="/", body=b"", headers=(), chunk_size=None):
+    """
+    Run one request through the ASGI app, return (status, headers, body chunks).
+    """
+    async def run():
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size and body else [body]
+        incoming = [{"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1} for index, chunk in enumerate(chunks)]
+        sent = []
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            # nothing more from the client until the response is done
+            while not any(m["type"] == "http.response.body" and not m.get("more_body") for m in sent):
+                await asyncio.sleep(0.01)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": method, "path": path, "headers": [(name.encode(), value.encode()) for name, value in headers]}
+        await app(scope, receive, send)
+        start = sent[0]
+        return start["status"], dict((name.decode(), value.decode()) for name, value in start["headers"]), [m["body"] for m in sent[1:] if m["body"]]
+    return asyncio.run(run())
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(api_code, "lambda_handler", lambda event, context: {"statusCode": 200, "headers": {"Content-Type": "application/json"}, "body": event["body"]})
+    server = ApiServer(workers=2, queue_size=1)
+    server.ready = True
+    yield server
+    server.executor.shutdown(wait=True)
+
+def test_post_goes_through_lambda_handler(app):
+    status, _, body = call(app, body=b'{"prompt": "hi"}', chunk_size=4)
+    assert status == 200
+    assert json.loads(b"".join(body)) == {"prompt": "hi"}
+
+def test_health_and_readiness(app):
+    assert call(app, "GET", "/healthz")[0] == 200
+    assert call(app, "GET", "/readyz")[0] == 200
+    assert call(app, "GET", "/")[0] == 405
+
+def test_rejects_oversized_bodies(app):
+    assert call(app, body=b"x" * (SERVER_MAX_BODY_BYTES + 1), chunk_size=64 * 1024)[0] == 413
+    assert call(app, headers=[("content-length", str(SERVER_MAX_BODY_BYTES + 1))])[0] == 413
+
+def test_full_queue_is_a_503(app):
+    app.admitted = app.workers + app.queue_size
+    status, headers, _ = call(app, body=b"{}")
+    assert status == 503
+    assert headers["retry-after"] == str(api_server.SERVER_RETRY_AFTER)
+
+def test_stream_sends_each_event(app, monkeypatch):
+    monkeypatch.setattr(api_code, "stream_search", lambda body, history: (api_code.sse_event(name, {}) for name in ("start", "flights", "done")))
+    status, headers, chunks = call(app, body=json.dumps({"prompt": "flights", "stream": True}).encode())
+    assert status == 200
+    assert headers["content-type"] == "text/event-stream"
+    assert len(chunks) == 3 and chunks[0].startswith(b"event: start")
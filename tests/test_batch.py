@@ -0,0 +1,44 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from batch import BATCH_MAX_ITEMS, run_batch
+
+def handle(event):
+    body = json.loads(event["body"])
+    if body["prompt"] == "fail":
+        return {"statusCode": 500, "body": json.dumps({"response": "upstream failed"})}
+    if body.get("hotelParams"):
+        # the direct hotel search answers without the API Gateway wrapping
+        return {"hotels": body["hotelParams"]["q"]}
+    return {"statusCode": 200, "body": json.dumps({"response": body["prompt"], "context": body.get("context")})}
+
+def run(body):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        return json.loads(run_batch(body, handle, executor)["body"])
+
+def test_results_keep_item_order_and_statuses():
+    result = run({"batch": ["a", "fail", {"hotelParams": {"q": "Rome"}}, 7], "context": "ctx", "concurrency": 2})
+    assert [item["status"] for item in result["results"]] == [200, 500, 200, 400]
+    assert result["results"][0]["result"] == {"response": "a", "context": "ctx"}
+    assert result["results"][1]["error"] == "upstream failed"
+    assert result["results"][2]["result"] == {"hotels": "Rome"}
+    assert result["errors"] == 2
+
+def test_identical_items_run_once():
+    result = run({"batch": ["a", "b", "a"]})
+    assert result["distinct"] == 2
+    assert result["results"][2]["duplicate_of"] == 0
+    assert result["results"][2]["result"] == result["results"][0]["result"]
+
+@pytest.mark.parametrize("body", [
+    {"batch": []},
+    {"batch": "a"},
+    {"batch": ["a"] * (BATCH_MAX_ITEMS + 1)},
+    {"batch": ["a", {"batch": ["b"]}]},
+    {"batch": ["a"], "concurrency": "lots"},
+])
+def test_rejects_bad_batches(body):
+    with pytest.raises(ValueError):
+        run(body)
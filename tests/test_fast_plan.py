@@ -0,0 +1,34 @@
+import pytest
+
+import api_code
+from api_code import fast_request_plan
+
+@pytest.mark.parametrize("text, kind, params", [
+    ("flights from Boston to Lisbon on 2099-05-03", "flight", {"departure_id": "BOS", "arrival_id": "LIS", "outbound_date": "2099-05-03"}),
+    ("hotels in Rome from 2099-11-03 to 2099-11-06", "hotel", {"q": "Rome", "check_in_date": "2099-11-03", "check_out_date": "2099-11-06"}),
+])
+def test_explicit_searches_skip_gpt(text, kind, params):
+    plan = fast_request_plan(text, "")
+    assert plan[kind] == text
+    assert params.items() <= plan[f"{kind}_params"].items()
+
+@pytest.mark.parametrize("text, history", [
+    ("flights from Boston to Lisbon on 2099-05-03", "User (Message #1): I live in Denver"),
+    ("flights from Boston to Lisbon on 2099-05-03 under $500", ""),
+    ("what are the best flights from Boston to Lisbon on 2099-05-03", ""),
+    ("flight from Boston to Lisbon on 2099-05-03 and a hotel", ""),
+    ("plan a trip to Lisbon", ""),
+])
+def test_anything_else_goes_to_gpt(text, history):
+    assert fast_request_plan(text, history) is None
+
+def test_analyze_intent_searches_without_a_gpt_call(monkeypatch):
+    def no_gpt(*args, **kwargs):
+        raise AssertionError("GPT was called")
+    searched = []
+    monkeypatch.setattr(api_code, "EXTRACTION_MODE", "single")
+    monkeypatch.setattr(api_code, "prompt_GPT", no_gpt)
+    monkeypatch.setattr(api_code, "get_search_results", lambda params, **kwargs: searched.append(params) or {"best_flights": []})
+    result = api_code.analyze_intent("x", "x", "x", "flights from Boston to Lisbon on 2099-05-03", "", concurrent=False)
+    assert searched[0]["departure_id"] == "BOS" and searched[0]["arrival_id"] == "LIS"
+    assert result["flights"] == {"best_flights": []}
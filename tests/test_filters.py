@@ -0,0 +1,76 @@
+import pytest
+
+from filters import FILTER_MAX_PAGE_SIZE, apply_view, parse_view
+
+def flight(price, legs=1, duration=300, hour=9, airline="Delta"):
+    return {
+        "price": price,
+        "total_duration": duration,
+        "flights": [
+            {"airline": airline, "departure_airport": {"time": f"2026-11-01 {hour:02d}:00"}} for _ in range(legs)
+        ]
+    }
+
+def hotel(price, rating, stars):
+    return {"rate_per_night": {"extracted_lowest": price}, "overall_rating": rating, "extracted_hotel_class": stars}
+
+@pytest.fixture
+def flights():
+    return {
+        "best_flights": [flight(500, legs=1), flight(300, legs=2)],
+        "other_flights": [flight(200, legs=1, hour=22), flight(800, legs=3), flight(400, legs=1)],
+        "freshness": {"fetched_at": "2026-10-17T00:00:00+00:00"}
+    }
+
+@pytest.fixture
+def hotels():
+    return {"properties": [hotel(120, 4.1, 3), hotel(300, 4.8, 5), hotel(90, 3.5, 2), hotel(200, None, 4)]}
+
+def prices(view):
+    return [option["price"] for option in view.get("best_flights", []) + view.get("other_flights", [])]
+
+def test_stops_filter(flights):
+    assert prices(apply_view('google_flights', 'stops', flights, {"stops": 0})) == [500, 200, 400]
+    assert prices(apply_view('google_flights', 'stops', flights, {"stops": 1})) == [300]
+    # -1 means any number of stops
+    assert len(prices(apply_view('google_flights', 'stops', flights, {"stops": -1}))) == 5
+
+def test_departure_time_wraps_past_midnight(flights):
+    assert prices(apply_view('google_flights', 'night', flights, {"departureTime": "night"})) == [200]
+
+def test_flight_sort_stays_within_best_and_other(flights):
+    view = apply_view('google_flights', 'sort', flights, sort="price")
+    assert [o["price"] for o in view["best_flights"]] == [300, 500]
+    assert [o["price"] for o in view["other_flights"]] == [200, 400, 800]
+    view = apply_view('google_flights', 'sort', flights, sort="-price")
+    assert [o["price"] for o in view["other_flights"]] == [800, 400, 200]
+
+def test_hotel_sort_puts_missing_values_last(hotels):
+    view = apply_view('google_hotels', 'rating', hotels, sort="-rating")
+    assert [p["overall_rating"] for p in view["properties"]] == [4.8, 4.1, 3.5, None]
+
+def test_hotel_filters(hotels):
+    view = apply_view('google_hotels', 'range', hotels, {"priceRange": {"min": 100, "max": 250}, "starRating": [3, 4]})
+    assert [p["rate_per_night"]["extracted_lowest"] for p in view["properties"]] == [120, 200]
+    assert view["view"]["matched"] == 2
+    assert view["view"]["total"] == 4
+
+def test_page_bounds(hotels):
+    view = apply_view('google_hotels', 'pages', hotels, page=2, page_size=3)
+    assert len(view["properties"]) == 1
+    assert view["view"]["pages"] == 2
+    assert apply_view('google_hotels', 'pages', hotels, page=5, page_size=3)["properties"] == []
+    # out of range sizes and pages are clamped
+    view = apply_view('google_hotels', 'pages', hotels, page=0, page_size=10 * FILTER_MAX_PAGE_SIZE)
+    assert view["view"]["page"] == 1
+    assert view["view"]["page_size"] == FILTER_MAX_PAGE_SIZE
+
+def test_errors_pass_through():
+    error = {"error": "no results"}
+    assert apply_view('google_hotels', 'error', error, {"starRating": [5]}) is error
+
+def test_parse_view():
+    assert parse_view(None, None, "2", "5") == ({}, None, 2, 5)
+    for view in ({"filters": []}, {"page": 1.5}, {"page_size": "ten"}, {"filters": {"priceRange": {"min": "a"}}}):
+        with pytest.raises(ValueError):
+            parse_view(**view)
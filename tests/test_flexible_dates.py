@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pytest
+
+from flexible_dates import FLEX_MAX_CELLS, flexible_date_cells, price_calendar
+
+OUTBOUND = date.today() + timedelta(days=30)
+
+def fake_search(params, limiter=None):
+    # one way fares get cheaper later in the week, round trips cost double
+    price = 500 - 10 * (date.fromisoformat(params["outbound_date"]) - OUTBOUND).days
+    if params.get("return_date"):
+        price *= 2
+    return {"best_flights": [{"price": price, "total_duration": 300, "flights": [{}]}]}
+
+def test_cells_cover_every_outbound_date_and_length():
+    cells, outbound_dates, lengths = flexible_date_cells({"outbound_date": OUTBOUND.isoformat()}, {"days": 2, "returnLengths": [3, 4]})
+    assert len(outbound_dates) == 5
+    assert lengths == [3, 4]
+    assert len(cells) == 10
+    assert (OUTBOUND, OUTBOUND + timedelta(days=4)) in cells
+
+def test_past_dates_are_skipped():
+    _, outbound_dates, _ = flexible_date_cells({"outbound_date": date.today().isoformat()}, {"days": 3})
+    assert outbound_dates[0] == date.today()
+
+def test_too_many_cells():
+    with pytest.raises(ValueError):
+        flexible_date_cells({"outbound_date": OUTBOUND.isoformat()}, {"days": 7, "returnLengths": [1, FLEX_MAX_CELLS]})
+
+def test_price_calendar_matrix():
+    events = []
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        calendar = price_calendar("key", {"outbound_date": OUTBOUND.isoformat(), "departure_id": "JFK"}, {"days": 1},
+                                  fake_search, executor, lambda event, data: events.append(data))
+    assert calendar["prices"] == [[510, 500, 490]]
+    assert calendar["return_lengths"] is None
+    assert calendar["cheapest"]["outbound_date"] == (OUTBOUND + timedelta(days=1)).isoformat()
+    assert len(events) == 3
+
+@pytest.mark.parametrize("flight_params, flexible", [
+    ({"outbound_date": "next week"}, {"days": 1}),
+    ({}, {"days": 1}),
+    ({"outbound_date": OUTBOUND.isoformat()}, {"days": "three"}),
+    ({"outbound_date": OUTBOUND.isoformat()}, {"returnLengths": ["3", "5"]}),
+    ({"outbound_date": OUTBOUND.isoformat()}, [3]),
+])
+def test_malformed_requests_raise_value_error(flight_params, flexible):
+    with pytest.raises(ValueError):
+        flexible_date_cells(flight_params, flexible)
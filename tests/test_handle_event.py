@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+import api_code
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    for name in api_code.REQUIRED_ENV_VARS:
+        monkeypatch.setenv(name, "test")
+    monkeypatch.setattr(api_code, "_CONFIG", None)
+
+def handle(body):
+    response = api_code.handle_event({"body": json.dumps(body)})
+    return response["statusCode"], json.loads(response["body"])
+
+@pytest.mark.parametrize("view", [
+    {"page": "two"},
+    {"pageSize": [10]},
+    {"filters": "cheap"},
+    {"filters": {"maxPrice": "500"}},
+    {"filters": {"airlines": "Delta"}},
+    {"sort": 1},
+])
+def test_invalid_view_is_a_400(view):
+    status, body = handle({"prompt": "flights to Paris", "isDirectFlightSearch": True, "flightParams": {"departure_id": "JFK"}, **view})
+    assert status == 400
+    assert body["response"].startswith("Invalid request: ")
+
+def test_invalid_weights_are_a_400():
+    status, body = handle({"prompt": "flights to Paris", "weights": {"price": -1}})
+    assert status == 400
+
+@pytest.mark.parametrize("flexible", [{"days": "three"}, {"days": 3, "returnLengths": [1, 400]}])
+def test_invalid_flexible_dates_are_a_400(flexible):
+    status, body = handle({"prompt": "flights", "isDirectFlightSearch": True, "flexibleDates": flexible,
+                           "flightParams": {"departure_id": "JFK", "arrival_id": "LIS", "outbound_date": "2099-05-01"}})
+    assert status == 400
+    assert "flexible" in body["error"] or "date pairs" in body["error"]
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "eyJwYXJhbXMiOnt9fQ", 42])
+def test_invalid_cursor_is_a_400(cursor):
+    status, body = handle({"cursor": cursor})
+    assert status == 400
+    assert body["error"] == "Invalid cursor"
+
+@pytest.mark.parametrize("batch", [[], ["a"] * 1000, [{"batch": ["a"]}]])
+def test_invalid_batch_is_a_400(batch):
+    status, _ = handle({"batch": batch})
+    assert status == 400
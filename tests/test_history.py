@@ -0,0 +1,52 @@
+import re
+
+from history import compact_history, get_history_stats, history_turns, remember_rewrite
+
+def format_chat_history(history):
+    # formatChatHistory from src/app/api/search/route.ts
+    recent = history[-5:]
+    messages = []
+    for index, (is_user, content) in enumerate(recent):
+        if not is_user:
+            content = '\n'.join(re.sub(r'^[-•*]\s*', f'[Item {i + 1}] ', line) if re.match(r'^[-•*]', line.strip()) else line
+                                for i, line in enumerate(content.split('\n')))
+        messages.append(f"{'User' if is_user else 'Assistant'} (Message #{index + 1}): {content}")
+    return ("Previous conversation with numbered references:\n" + '\n\n'.join(reversed(messages)) +
+            "\n\nNote: Messages are numbered chronologically (1 being oldest, 5 being most recent). \n"
+            "List items within assistant responses are marked with [Item X].\n"
+            "If a budget is specified, consider it for the entire trip including activities.")
+
+def frontend_history(history):
+    # the context route.ts sends, cut the way extract_conversation_history does
+    context = f"Previous conversation:\n{format_chat_history(history)}\n\nBe accurate and straightforward."
+    return context.split("Previous conversation:", 1)[1].split("Be accurate", 1)[0].strip()
+
+def test_turns_from_the_frontend_format():
+    history = frontend_history([(True, "flights to Lisbon"), (False, "Here are flights:\n- TAP $420\n- United $510"), (True, "in May")])
+    assert history_turns(history) == [
+        ("user", "flights to Lisbon"),
+        ("assistant", "Here are flights:\n[Item 2] TAP $420\n[Item 3] United $510"),
+        ("user", "in May"),
+    ]
+
+def test_cache_hits_as_the_window_slides():
+    prompts = ["flights from Boston to Lisbon", "in May", "for two adults", "under $900", "and a hotel near the center", "with breakfast"]
+    chat, hits = [], 0
+    for turn, prompt in enumerate(prompts):
+        before = get_history_stats()["hits"]
+        history, last_turn = compact_history(frontend_history(chat) if chat else "")
+        hits += get_history_stats()["hits"] - before
+        if turn > 0:
+            assert history.startswith("Summary of the earlier conversation: rewrite of turn %d" % (turn - 1))
+            # only the assistant reply after the cached turn is sent
+            assert history.count("Assistant: ") == 1 and "User: " not in history
+            assert "Message #" not in history and "Note:" not in history
+        remember_rewrite(last_turn, prompt, f"rewrite of turn {turn}")
+        chat += [(True, prompt), (False, f"Results for {prompt}:\n- option one\n- option two")]
+    assert hits == len(prompts) - 1
+
+def test_hand_written_history_is_one_turn_per_line():
+    _, last_turn = compact_history("User: Hotels in  Rome")
+    remember_rewrite(last_turn, "for two nights", "Hotels in Rome for two nights")
+    history, _ = compact_history("hotels in rome\nFOR TWO NIGHTS\nwith a pool")
+    assert history == "Summary of the earlier conversation: Hotels in Rome for two nights\nUser: with a pool"
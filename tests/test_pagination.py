@@ -0,0 +1,47 @@
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, iter_search_pages, with_cursor
+
+PARAMS = {"api_key": "secret", "engine": "google_hotels", "q": "Rome"}
+
+def test_cursor_round_trip_drops_the_api_key():
+    cursor = encode_cursor(PARAMS, "token-2")
+    assert "secret" not in base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    assert decode_cursor(cursor) == {"engine": "google_hotels", "q": "Rome", "next_page_token": "token-2"}
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 !",
+    raw_cursor(["a list"]),
+    raw_cursor({"params": {"engine": "google_hotels"}}),
+    raw_cursor({"params": {"engine": "google_hotels"}, "token": ""}),
+    raw_cursor({"params": {"engine": "google"}, "token": "t"}),
+    raw_cursor({"params": "Rome", "token": "t"}),
+])
+def test_decode_cursor_rejects_cursors_it_did_not_issue(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_with_cursor_only_when_there_is_a_next_page():
+    assert "next_cursor" not in with_cursor({"properties": []}, PARAMS)
+    result = with_cursor({"serpapi_pagination": {"next_page_token": "t"}}, PARAMS)
+    assert decode_cursor(result["next_cursor"])["next_page_token"] == "t"
+
+def test_iter_search_pages_follows_tokens():
+    pages = {None: "t2", "t2": "t3", "t3": None}
+    seen = []
+
+    def search(params):
+        token = params.get("next_page_token")
+        seen.append(token)
+        return {"page": token, "serpapi_pagination": {"next_page_token": pages[token]} if pages[token] else {}}
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert [page["page"] for page in iter_search_pages(PARAMS, search, executor, prefetch=False)] == [None, "t2", "t3"]
+    assert seen == [None, "t2", "t3"]
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+import ranking
+from api_code import stay_nights
+from ranking import parse_weights, rank_trips
+
+def flights(prices):
+    return {
+        "best_flights": [
+            {"price": price, "total_duration": 300 + 10 * i, "flights": [{}] * (1 + i % 2)}
+            for i, price in enumerate(prices)
+        ]
+    }
+
+def hotels(nightly, rating=4.0):
+    return {
+        "properties": [
+            {"rate_per_night": {"extracted_lowest": rate}, "overall_rating": rating - 0.1 * i}
+            for i, rate in enumerate(nightly)
+        ]
+    }
+
+@pytest.fixture
+def python_only(monkeypatch):
+    monkeypatch.setattr(ranking, "_NUMPY", False)
+
+def test_numpy_and_python_paths_agree(monkeypatch):
+    pytest.importorskip("numpy")
+    rng = random.Random(7)
+    flight_info = flights([rng.randint(100, 900) for _ in range(30)])
+    hotel_info = hotels([rng.randint(50, 400) for _ in range(25)])
+    args = dict(budget=2000, weights={"rating": 1.0}, top_k=10, nights=4)
+
+    with_numpy = rank_trips(flight_info, hotel_info, **args)
+    monkeypatch.setattr(ranking, "_NUMPY", False)
+    without_numpy = rank_trips(flight_info, hotel_info, **args)
+
+    assert [trip["total_cost"] for trip in with_numpy] == [trip["total_cost"] for trip in without_numpy]
+    assert [trip["score"] for trip in with_numpy] == pytest.approx([trip["score"] for trip in without_numpy])
+
+def test_nightly_rates_are_multiplied_by_the_nights(python_only):
+    trips = rank_trips(flights([300]), hotels([100]), budget=1000, nights=3)
+    assert trips[0]["hotel"]["price"] == 300
+    assert trips[0]["hotel"]["nightly"] == 100
+    assert trips[0]["total_cost"] == 600
+    assert trips[0]["remaining_budget"] == 400
+
+def test_over_budget_combinations_rank_last(python_only):
+    trips = rank_trips(flights([200, 900]), hotels([100, 50]), budget=500, top_k=4)
+    assert [trip["within_budget"] for trip in trips] == [True, True, False, False]
+
+def test_one_side_only():
+    trips = rank_trips(flights([400, 250]), None, budget=1000)
+    assert [trip["flight"]["price"] for trip in trips] == [250, 400]
+    assert all("hotel" not in trip for trip in trips)
+    assert rank_trips(None, None, budget=1000) == []
+
+def test_parse_weights():
+    assert parse_weights(None) == {}
+    assert parse_weights({"price": 2, "rating": 0.5}) == {"price": 2.0, "rating": 0.5}
+    for bad in ({"price": "high"}, {"price": -1}, {"price": True}, {"comfort": 1}, ["price"]):
+        with pytest.raises(ValueError):
+            parse_weights(bad)
+
+def test_stay_nights():
+    assert stay_nights({"check_in_date": "2026-11-01", "check_out_date": "2026-11-04"}) == 3
+    assert stay_nights({"check_in_date": "2026-11-04", "check_out_date": "2026-11-01"}) is None
+    assert stay_nights({"q": "Paris"}) is None
@@ -0,0 +1,29 @@
+import pytest
+
+from api_code import FAST_PATH_MIN_CONFIDENCE, resolve_place
+
+@pytest.mark.parametrize("city, expected", [
+    ("Berlin", {"TXL", "SXF"}),
+    ("Milan", {"LIN", "MXP"}),
+    ("Bangkok", {"BKK", "DMK"}),
+    ("Dallas", {"DFW", "DAL"}),
+    ("Istanbul", {"IST", "SAW"}),
+    ("Rome", {"FCO", "CIA"}),
+    ("New York", {"JFK", "LGA"}),
+    ("Paris", {"CDG", "ORY"}),
+])
+def test_multi_airport_cities_are_left_to_gpt(city, expected):
+    codes, confidence = resolve_place(city)
+    assert confidence < FAST_PATH_MIN_CONFIDENCE
+    assert expected <= set(codes.split(','))
+
+@pytest.mark.parametrize("city, code", [("Boston", "BOS"), ("Lisbon", "LIS")])
+def test_single_airport_cities_take_the_fast_path(city, code):
+    assert resolve_place(city) == (code, 0.9)
+
+def test_iata_codes_resolve_as_is():
+    assert resolve_place("JFK") == ("JFK", 1.0)
+
+def test_unknown_places_do_not_resolve():
+    assert resolve_place("Atlantis") == (None, 0.0)
+    assert resolve_place("  ") == (None, 0.0)
@@ -0,0 +1,30 @@
+import os
+import threading
+import time
+
+from singleflight import SingleFlight
+
+def slow_call(counter, value):
+    def call():
+        with counter["lock"]:
+            counter["calls"] += 1
+        time.sleep(0.2)
+        return {"value": value}
+    return call
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    counter = {"calls": 0, "lock": threading.Lock()}
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow_call(counter, 1)))) for _ in range(5)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+    assert counter["calls"] == 1
+    assert results == [{"value": 1}] * 5
+    assert flight.snapshot()["coalescing_ratio"] == 0.8
+
+def test_cross_process_mode_leaves_no_files(tmp_path):
+    flight = SingleFlight(str(tmp_path))
+    counter = {"calls": 0, "lock": threading.Lock()}
+    assert flight.do("k", slow_call(counter, 2)) == {"value": 2}
+    assert os.listdir(tmp_path) == []